@@ -0,0 +1,59 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+# Per-segment pen handling in Stroke.paint_range / paint_segment, which both live ink and replay go through,
+# against a QPen built for every segment; run from the repository root with python -m benchmarks.bench_pens
+
+import os
+import timeit
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+########### PyQT5 imports ###########
+from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtGui import QColor, QImage, QPainter
+
+from src.lotusStrokes import Stroke
+
+POINTS = 1000
+REPEAT = 20
+
+
+def make_stroke(pressure:bool):
+    stroke = Stroke("PEN", QColor(Qt.black), 5, pressure)
+    for index in range(POINTS):
+        stroke.add_point(QPoint(index, index % 50), 2 + index % 7 if pressure else None)
+    return stroke
+
+
+def fresh_range(stroke:Stroke, painter:QPainter):
+    # The same segments, with a new QPen for every one of them
+    for index in range(1, stroke.point_count()):
+        painter.setPen(stroke.pen(stroke.widths[index] if stroke.widths is not None else None))
+        painter.drawLine(stroke.points[2 * index - 2], stroke.points[2 * index - 1], stroke.points[2 * index], stroke.points[2 * index + 1])
+
+
+def best(function, number:int):
+    # Milliseconds per call, best of five runs
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1000
+
+
+def main():
+    image = QImage(POINTS + 16, 64, QImage.Format_ARGB32_Premultiplied)
+    painter = QPainter(image)
+    for name, pressure in (("constant width", False), ("pressure", True)):
+        stroke = make_stroke(pressure)
+        reused = best(lambda: stroke.paint_range(painter, 1), REPEAT)
+        fresh = best(lambda: fresh_range(stroke, painter), REPEAT)
+        print("%s, %d segments: paint_range %.2f ms (%.2f us/segment), pen per segment %.2f ms (%.1fx)"
+              % (name, POINTS - 1, reused, reused * 1000 / (POINTS - 1), fresh, fresh / reused))
+    painter.end()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+# Marks the repository root for pytest, which puts it on sys.path so tests can import src and benchmarks from a plain pytest run
@@ -4,6 +4,7 @@ CONFIG_FILE = os.path.join(os.path.abspath(os.path.dirname( __file__ )), 'data/c
 SCHEDULE_FILE_PATH  = os.path.join(os.path.abspath(os.path.dirname( __file__ )), 'data/schedule.json')
 SCHEDULED_NOTES_DIRECTORY = os.path.join(os.path.abspath(os.path.dirname( __file__ )), 'data/')
 DIRECTORY_FILE = os.path.join(os.path.abspath(os.path.dirname( __file__ )), 'data/directories.txt')
+JOURNAL_DIRECTORY = os.path.join(os.path.abspath(os.path.dirname( __file__ )), 'data/journals/')
 
 ########### Assets ###########
 assets = {
@@ -10,7 +10,7 @@
 import src.wsl
 ########### PyQT5 imports ###########
 import sys
-from PyQt5.QtWidgets import QApplication , QMainWindow , QPushButton , QWidget
+from PyQt5.QtWidgets import QApplication , QMainWindow , QPushButton , QWidget , QMessageBox
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import Qt
 ########### File imports ###########
@@ -20,7 +20,8 @@ from src.lotusNotes import UINoteWindow, set_default_eraser_width, set_default_p
 from src.lotusPrevious import UIPreviousWindow
 from src.lotusCalender import UICalendarWindow, Schedule
 from src.lotusSettings import UISettingsWindow
-from src.constants import CONFIG_FILE, SCHEDULED_NOTES_DIRECTORY
+from src.lotusJournal import unsaved_journals
+from src.constants import CONFIG_FILE, JOURNAL_DIRECTORY, SCHEDULED_NOTES_DIRECTORY
 ########### Other imports ###########
 import os
 
@@ -38,6 +39,7 @@ class MainWindow(QMainWindow):
         self.newNotes = []
         self.initUI()
         self.HubWindowSeparate()
+        self.recoverSessions()
 
         ###### Attempting to center (experimental) ######
 
@@ -54,7 +56,19 @@ class MainWindow(QMainWindow):
                                  'Name_Heading': 'True',
                                  'Default_Font': 'Sans Serif',
                                  'Default_Style': 'Normal',
-                                 'Default_Font_Size': '12'}
+                                 'Default_Font_Size': '12',
+                                 'Undo_Budget_MB': '64',
+                                 'Undo_Checkpoint_Interval': '16',
+                                 'Target_FPS': '0',
+                                 'Page_Size': 'Letter',
+                                 'Page_DPI': '96',
+                                 'Page_Growth_Factor': '1.5',
+                                 'Page_Growth_Cap': '2048',
+                                 'Eraser_Mode': 'Partial',
+                                 'Stroke_Min_Distance': '2',
+                                 'Stroke_Tolerance': '0.75',
+                                 'Stroke_Smoothing': 'False',
+                                 'Autosave_Interval_MS': '500'}
             config.write(file)
         file.close()
 
@@ -107,8 +121,25 @@ class MainWindow(QMainWindow):
             #self.raise_()
 
 
-    def NoteWindowSeparate(self, file_path=None, scheduled=False, event_name=None, event_date=None, event_time=None):
-        window = UINoteWindow(self.schedule, file_path=file_path, scheduled=scheduled)
+    def recoverSessions(self):
+        # Notes still journaled at startup were never saved or discarded, i.e. Lotus didn't exit cleanly
+        journals = unsaved_journals(JOURNAL_DIRECTORY)
+        if len(journals) == 0:
+            return
+        answer = QMessageBox.question(self.HubWindow, "Recover Notes",
+                                      "Lotus closed with {} unsaved note(s). Recover them?".format(len(journals)),
+                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        # The journals stay locked while the question is up, so another instance starting meanwhile can't claim them too
+        for journal, lock in journals:
+            if answer == QMessageBox.Yes:
+                lock.unlock()
+                self.NoteWindowSeparate(recover=journal)
+            else:
+                os.remove(journal)
+                lock.unlock()
+
+    def NoteWindowSeparate(self, file_path=None, scheduled=False, event_name=None, event_date=None, event_time=None, recover=None):
+        window = UINoteWindow(self.schedule, file_path=file_path, scheduled=scheduled, recover=recover)
         self.newNotes.append(window)
         if file_path:
             if scheduled:
@@ -120,6 +151,8 @@ class MainWindow(QMainWindow):
             else:
                 window.deleted_file.connect(self.PreviousWindow.delete_button)
                 self.newNotes[self.newNoteCount].setWindowTitle(file_path)
+        elif recover:
+            self.newNotes[self.newNoteCount].setWindowTitle((window.file_path or "New Note") + " - Recovered")
         else:
             self.newNotes[self.newNoteCount].setWindowTitle("New Note " + str(self.newNoteCount + 1))
         self.newNotes[self.newNoteCount].home_button.clicked.connect(self.HubWindowSeparate)
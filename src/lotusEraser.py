@@ -0,0 +1,158 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+import numpy as np
+
+########### PyQT5 imports ###########
+from PyQt5.QtCore import QPoint
+
+from src.lotusStrokes import Stroke
+
+
+def point_segment_distance(points, starts, ends):
+    # Distance from each point to the matching segment; all arguments broadcast as (..., 2) arrays
+    direction = ends - starts
+    length = np.einsum('...i,...i->...', direction, direction)
+    t = np.einsum('...i,...i->...', points - starts, direction) / np.where(length > 0, length, 1)
+    t = np.clip(t, 0, 1)
+    nearest = starts + t[..., None] * direction
+    return np.hypot(*(points - nearest).T)
+
+
+def cross(origin, a, b):
+    return (a[..., 0] - origin[..., 0]) * (b[..., 1] - origin[..., 1]) - (a[..., 1] - origin[..., 1]) * (b[..., 0] - origin[..., 0])
+
+
+def stroke_points(stroke:Stroke):
+    return np.frombuffer(stroke.points, dtype=np.int32).reshape(-1, 2).astype(np.float64)
+
+
+def stroke_reach(stroke:Stroke, radius:float):
+    # How close the eraser center may come to a point before it touches ink, per point
+    if stroke.widths is not None:
+        return radius / 2 + np.frombuffer(stroke.widths, dtype=np.float32) / 2
+    return np.full(stroke.point_count(), radius / 2 + stroke.width / 2)
+
+
+def segment_reach(stroke:Stroke, radius:float):
+    # Reach per segment, the larger of its two ends'
+    reach = stroke_reach(stroke, radius)
+    return np.maximum(reach[:-1], reach[1:]) if len(reach) > 1 else reach
+
+
+def eraser_path(start, end):
+    return np.array((start.x(), start.y()), dtype=np.float64), np.array((end.x(), end.y()), dtype=np.float64)
+
+
+def erased_segments(stroke:Stroke, start, end, radius:float):
+    # Which segments of the stroke the eraser touches while moving from start to end
+    # A single-point stroke is treated as one zero-length segment
+    points = stroke_points(stroke)
+    if len(points) == 1:
+        points = np.vstack((points, points))
+    reach = segment_reach(stroke, radius)
+    a, b = eraser_path(start, end)
+    starts = points[:-1]
+    ends = points[1:]
+    distance = np.minimum(np.minimum(point_segment_distance(starts, a, b), point_segment_distance(ends, a, b)),
+                          np.minimum(point_segment_distance(a, starts, ends), point_segment_distance(b, starts, ends)))
+    # Segments that properly cross the eraser path are hit even when every endpoint is far from it
+    crossing = (np.sign(cross(a, b, starts)) * np.sign(cross(a, b, ends)) < 0) & \
+               (np.sign(cross(starts, ends, a)) * np.sign(cross(starts, ends, b)) < 0)
+    return (distance <= reach) | crossing
+
+
+def slab_span(offset, step, low, high):
+    # Values of t for which offset + t * step lies in [low, high], per row; rows that never do get enter > leave
+    inside = (offset >= low) & (offset <= high)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        first = (low - offset) / step
+        second = (high - offset) / step
+    moving = step != 0
+    enter = np.where(moving, np.minimum(first, second), np.where(inside, -np.inf, np.inf))
+    leave = np.where(moving, np.maximum(first, second), np.where(inside, np.inf, -np.inf))
+    return enter, leave
+
+
+def swept_spans(starts, ends, a, b, reach):
+    # Part of each segment within reach of the eraser path a-b, as t0 <= t1 along it; t0 > t1 if there is none
+    # The swept area is convex, so that part is one interval: the hull of where the segment overlaps the circles
+    # around a and b and the rectangle between them
+    direction = ends - starts
+    low = np.full(len(starts), np.inf)
+    high = np.full(len(starts), -np.inf)
+    length = np.einsum('ij,ij->i', direction, direction)
+    for center in (a, b):
+        offset = starts - center
+        half = np.einsum('ij,ij->i', offset, direction)
+        rest = np.einsum('ij,ij->i', offset, offset) - reach * reach
+        discriminant = half * half - length * rest
+        root = np.sqrt(np.maximum(discriminant, 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            first = np.where(length > 0, (-half - root) / length, -np.inf)
+            second = np.where(length > 0, (-half + root) / length, np.inf)
+        hit = np.where(length > 0, discriminant >= 0, rest <= 0)
+        low = np.where(hit, np.minimum(low, first), low)
+        high = np.where(hit, np.maximum(high, second), high)
+    span = np.hypot(*(b - a))
+    if span > 0:
+        along = (b - a) / span
+        across = np.array((-along[1], along[0]))
+        enter, leave = slab_span((starts - a) @ along, direction @ along, 0, span)
+        side_enter, side_leave = slab_span((starts - a) @ across, direction @ across, -reach, reach)
+        enter = np.maximum(enter, side_enter)
+        leave = np.minimum(leave, side_leave)
+        hit = enter <= leave
+        low = np.where(hit, np.minimum(low, enter), low)
+        high = np.where(hit, np.maximum(high, leave), high)
+    missed = (high < 0) | (low > 1) | (low > high)
+    return np.where(missed, 1, np.clip(low, 0, 1)), np.where(missed, 0, np.clip(high, 0, 1))
+
+
+def split_stroke(stroke:Stroke, erased, start, end, radius:float):
+    # Pieces left of the stroke, cut where each erased segment enters and leaves the eraser's path so the ink
+    # outside of it stays, however long the segment; cut ends keep the width of the segment they were cut from
+    if stroke.point_count() == 1:
+        return [] if erased.any() else [stroke]
+    points = stroke_points(stroke)
+    a, b = eraser_path(start, end)
+    enter, leave = swept_spans(points[:-1], points[1:], a, b, segment_reach(stroke, radius))
+    widths = stroke.widths
+
+    def sample(index:int):
+        return QPoint(int(points[index][0]), int(points[index][1])), widths[index] if widths is not None else None
+
+    def cut(index:int, t:float):
+        point = points[index] + t * (points[index + 1] - points[index])
+        return QPoint(round(point[0]), round(point[1])), widths[index + 1] if widths is not None else None
+
+    def extend(piece:list, sample):
+        if len(piece) == 0 or piece[-1][0] != sample[0]:
+            piece.append(sample)
+
+    pieces = []
+    piece = None
+    for index in range(len(erased)):
+        if not erased[index] or enter[index] > leave[index]:
+            if piece is None:
+                piece = [sample(index)]
+            extend(piece, sample(index + 1))
+            continue
+        if enter[index] > 0:
+            if piece is None:
+                piece = [sample(index)]
+            extend(piece, cut(index, enter[index]))
+        if piece is not None:
+            pieces.append(piece)
+            piece = None
+        if leave[index] < 1:
+            piece = [cut(index, leave[index])]
+            extend(piece, sample(index + 1))
+    if piece is not None:
+        pieces.append(piece)
+    return [stroke.cut(piece) for piece in pieces]
@@ -164,6 +164,63 @@ class FloatingWidget(QtWidgets.QWidget):
         self.top_side = False
         self.bottom_side = False
 
-
-
-
+    def state(self):
+        # Plain description of the widget and its contents, enough for restore_widget() to rebuild it
+        child = self.child_widget
+        state = {'x': self.x(), 'y': self.y(), 'width': self.width(), 'height': self.height(),
+                 'child_width': child.width(), 'child_height': child.height(),
+                 'resize_child': self.resize_child, 'heading': self.is_heading,
+                 'font': child.font().toString()}
+        if isinstance(child, QtWidgets.QPlainTextEdit):
+            state['kind'] = 'text'
+            state['text'] = child.toPlainText()
+        elif isinstance(child, QtWidgets.QLineEdit):
+            state['kind'] = 'caption'
+            state['text'] = child.text()
+        elif isinstance(child, QtWidgets.QTableWidget):
+            state['kind'] = 'table'
+            state['rows'] = child.rowCount()
+            state['columns'] = child.columnCount()
+            state['cells'] = [[child.item(row, column).text() if child.item(row, column) is not None else ''
+                               for column in range(child.columnCount())] for row in range(child.rowCount())]
+        elif isinstance(child, QtWidgets.QLabel) and child.pixmap() is not None:
+            state['kind'] = 'image'
+            state['image'] = child.pixmap().toImage()
+        else:
+            return None
+        return state
+
+
+def restore_widget(state, parent):
+    # Inverse of FloatingWidget.state()
+    width = state['child_width']
+    height = state['child_height']
+    if state['kind'] == 'text':
+        child = QtWidgets.QPlainTextEdit(state['text'])
+        child.setGeometry(0, 0, width, height)
+        child.setFixedHeight(height)
+    elif state['kind'] == 'caption':
+        child = QtWidgets.QLineEdit(state['text'])
+        child.setGeometry(0, 0, width, height)
+        child.setFixedHeight(height)
+    elif state['kind'] == 'table':
+        child = QtWidgets.QTableWidget(state['rows'], state['columns'])
+        for row, cells in enumerate(state['cells']):
+            for column, text in enumerate(cells):
+                if text:
+                    child.setItem(row, column, QtWidgets.QTableWidgetItem(text))
+        child.setSizePolicy(QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Minimum)
+        child.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        child.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        child.setFixedSize(width, height)
+    else:
+        child = QtWidgets.QLabel()
+        child.setPixmap(QtGui.QPixmap.fromImage(state['image']))
+        child.setGeometry(0, 0, width, height)
+    font = QtGui.QFont()
+    if font.fromString(state['font']):
+        child.setFont(font)
+    widget = FloatingWidget(child, parent, state['x'], state['y'], state['resize_child'])
+    widget.resize(state['width'], state['height'])
+    widget.is_heading = state['heading']
+    return widget
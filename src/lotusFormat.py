@@ -0,0 +1,281 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+import json
+import struct
+import zlib
+from array import array
+
+import numpy as np
+
+########### PyQT5 imports ###########
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QPoint, QRect, QSize
+from PyQt5.QtGui import QColor, QImage
+
+from src.lotusStrokes import Stroke, Highlight, Stamp
+
+# File layout: header, uncompressed PNG thumbnail (so previews never touch the rest), then the zlib-compressed body
+NOTE_SUFFIX = '.lotus'
+NOTE_MAGIC = b'LOTUS'
+NOTE_VERSION = 1
+HEADER = struct.Struct('<5sHI')
+THUMBNAIL_WIDTH = 256
+
+# Record kinds in the record stream
+STROKE = 0
+STAMP = 1
+
+# Pressure widths are kept to 1/16 px
+WIDTH_SCALE = 16
+
+
+class Note:
+    # Everything a .lotus file holds, detached from the canvas so it can be encoded away from the GUI thread
+    def __init__(self, page_size:QSize, records:list, highlights:list, widgets:list, base=None, thumbnail:QImage=None):
+        self.page_size = QSize(page_size)
+        self.records = records
+        self.highlights = highlights
+        # FloatingWidget.state() dicts; QImage values are stored as blobs
+        self.widgets = widgets
+        # Path or encoded bytes of the image the note was started from
+        self.base = base
+        self.thumbnail = thumbnail
+
+
+def zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def unzigzag(values):
+    values = np.asarray(values, dtype=np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def encode_varints(values):
+    # LEB128 for a whole array at once: 7 bits per byte, high bit set on every byte but the last
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    rest = values.copy()
+    for byte in range(int(lengths.max()) if len(values) > 0 else 0):
+        active = lengths > byte
+        more = (lengths[active] > byte + 1).astype(np.uint8) << 7
+        out[starts[active] + byte] = (rest[active] & np.uint64(0x7f)).astype(np.uint8) | more
+        rest[active] >>= np.uint64(7)
+    return out.tobytes()
+
+
+def decode_varints(data, count:int, offset=0):
+    # Returns the first count varints of data from offset, and the offset just past them
+    if count == 0:
+        return np.zeros(0, dtype=np.uint64), offset
+    raw = np.frombuffer(data, dtype=np.uint8, offset=offset)
+    ends = np.flatnonzero(raw < 0x80)[:count]
+    if len(ends) < count:
+        raise ValueError("Truncated note")
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    values = np.zeros(count, dtype=np.uint64)
+    for byte in range(int(lengths.max())):
+        active = lengths > byte
+        values[active] |= (raw[starts[active] + byte] & 0x7f).astype(np.uint64) << np.uint64(7 * byte)
+    return values, offset + int(ends[-1]) + 1
+
+
+def image_bytes(image:QImage):
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    buffer.close()
+    return bytes(data)
+
+
+def pack(values):
+    # Section of unsigned varints with its own count in front
+    return encode_varints([len(values)]) + encode_varints(values)
+
+
+def unpack(data, offset=0):
+    count, offset = decode_varints(data, 1, offset)
+    return decode_varints(data, int(count[0]), offset)
+
+
+def running_sums(deltas, counts:list):
+    # Cumulative sums restarting at every run of counts rows
+    if len(deltas) == 0:
+        return deltas
+    totals = np.cumsum(deltas, axis=0)
+    ends = np.cumsum(counts) - 1
+    offsets = np.concatenate((np.zeros((1,) + totals.shape[1:], dtype=totals.dtype), totals[ends[:-1]]))
+    return totals - np.repeat(offsets, counts, axis=0)
+
+
+def encode_body(note:Note):
+    blobs = []
+    utensils = []
+    meta = []
+    points = []
+    widths = []
+    for record in note.records:
+        if isinstance(record, Stamp):
+            meta += [STAMP, int(zigzag(record.pos.x())), int(zigzag(record.pos.y())), len(blobs)]
+            blobs.append(image_bytes(record.image))
+            continue
+        if record.utensil not in utensils:
+            utensils.append(record.utensil)
+        flags = (record.widths is not None) | (record.smooth << 1)
+        meta += [STROKE, utensils.index(record.utensil), record.rgba, record.width, flags, record.point_count()]
+        points.append(np.frombuffer(record.points, dtype=np.int32))
+        if record.widths is not None:
+            widths.append(np.round(np.frombuffer(record.widths, dtype=np.float32) * WIDTH_SCALE).astype(np.int64))
+    # Points are stored as deltas from the previous point of the same stroke, widths likewise
+    coordinates = np.concatenate(points).astype(np.int64).reshape(-1, 2) if len(points) > 0 else np.zeros((0, 2), dtype=np.int64)
+    deltas = np.diff(coordinates, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    starts = np.cumsum([0] + [len(stroke) // 2 for stroke in points[:-1]]) if len(points) > 0 else []
+    deltas[starts] = coordinates[starts]
+    width_values = np.concatenate(widths) if len(widths) > 0 else np.zeros(0, dtype=np.int64)
+    width_deltas = np.diff(width_values, prepend=0)
+    width_starts = np.cumsum([0] + [len(stroke) for stroke in widths[:-1]]) if len(widths) > 0 else []
+    width_deltas[width_starts] = width_values[width_starts]
+
+    widgets = []
+    for state in note.widgets:
+        state = dict(state)
+        for key, value in state.items():
+            if isinstance(value, QImage):
+                state[key] = {'blob': len(blobs)}
+                blobs.append(image_bytes(value))
+        widgets.append(state)
+    base = None
+    if note.base is not None:
+        base = len(blobs)
+        if isinstance(note.base, bytes):
+            blobs.append(note.base)
+        else:
+            with open(note.base, 'rb') as file:
+                blobs.append(file.read())
+    info = {'page': [note.page_size.width(), note.page_size.height()],
+            'utensils': utensils,
+            'highlights': [[record.rect.x(), record.rect.y(), record.rect.width(), record.rect.height(), record.rgba] for record in note.highlights],
+            'widgets': widgets,
+            'base': base}
+    info = json.dumps(info).encode('utf-8')
+    return b''.join([pack([len(info)]), info,
+                     pack(meta),
+                     pack(zigzag(deltas.reshape(-1))),
+                     pack(zigzag(width_deltas)),
+                     pack([len(blob) for blob in blobs])] + blobs)
+
+
+def write_note(path:str, note:Note):
+    thumbnail = image_bytes(note.thumbnail) if note.thumbnail is not None else b''
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(NOTE_MAGIC, NOTE_VERSION, len(thumbnail)))
+        file.write(thumbnail)
+        file.write(zlib.compress(encode_body(note), 6))
+
+
+def read_header(file):
+    magic, version, thumbnail_length = HEADER.unpack(file.read(HEADER.size))
+    if magic != NOTE_MAGIC:
+        raise ValueError("Not a Lotus note")
+    if version > NOTE_VERSION:
+        raise ValueError("Note was saved by a newer version of Lotus")
+    return version, thumbnail_length
+
+
+def read_thumbnail(path:str):
+    with open(path, 'rb') as file:
+        _, length = read_header(file)
+        return QImage.fromData(file.read(length))
+
+
+def read_note(path:str):
+    with open(path, 'rb') as file:
+        _, thumbnail_length = read_header(file)
+        file.seek(thumbnail_length, 1)
+        return decode_body(zlib.decompress(file.read()))
+
+
+def decode_body(body):
+    info_length, offset = unpack(body)
+    info_length = int(info_length[0])
+    info = json.loads(body[offset:offset + info_length].decode('utf-8'))
+    offset += info_length
+    meta, offset = unpack(body, offset)
+    deltas, offset = unpack(body, offset)
+    width_deltas, offset = unpack(body, offset)
+    blob_lengths, offset = unpack(body, offset)
+    blobs = []
+    for length in blob_lengths.tolist():
+        blobs.append(body[offset:offset + length])
+        offset += length
+
+    meta = meta.tolist()
+    entries = []
+    counts = []
+    width_counts = []
+    index = 0
+    while index < len(meta):
+        if meta[index] == STAMP:
+            entries.append(meta[index:index + 4])
+            index += 4
+        else:
+            entries.append(meta[index:index + 6])
+            counts.append(meta[index + 5])
+            if meta[index + 4] & 1:
+                width_counts.append(meta[index + 5])
+            index += 6
+    # Undoes the per-stroke deltas for every stroke at once: a running sum, less the sum up to each stroke's start
+    coordinates = running_sums(unzigzag(deltas).reshape(-1, 2), counts).astype(np.int32)
+    widths = (running_sums(unzigzag(width_deltas), width_counts) / WIDTH_SCALE).astype(np.float32)
+    starts = np.cumsum([0] + counts[:-1]).astype(np.int64)
+    if len(counts) > 0:
+        low = np.minimum.reduceat(coordinates, starts).tolist()
+        high = np.maximum.reduceat(coordinates, starts).tolist()
+
+    records = []
+    stroke_index = 0
+    point = 0
+    width = 0
+    for entry in entries:
+        if entry[0] == STAMP:
+            pos = QPoint(*unzigzag(entry[1:3]).tolist())
+            records.append(Stamp(pos, QImage.fromData(blobs[entry[3]])))
+            continue
+        _, utensil, rgba, stroke_width, flags, count = entry
+        stroke = Stroke(info['utensils'][utensil], QColor.fromRgba(rgba), stroke_width, bool(flags & 1))
+        stroke_widths = None
+        if flags & 1:
+            stroke_widths = array('f', widths[width:width + count].tobytes())
+            width += count
+        (left, top), (right, bottom) = low[stroke_index], high[stroke_index]
+        stroke.set_points(array('i', coordinates[point:point + count].tobytes()), stroke_widths,
+                          QRect(left, top, right - left + 1, bottom - top + 1))
+        if flags & 2:
+            stroke.smoothen()
+        records.append(stroke)
+        point += count
+        stroke_index += 1
+
+    highlights = [Highlight(QRect(x, y, w, h), QColor.fromRgba(rgba)) for x, y, w, h, rgba in info['highlights']]
+    widgets = []
+    for state in info['widgets']:
+        for key, value in state.items():
+            if isinstance(value, dict) and 'blob' in value:
+                state[key] = QImage.fromData(blobs[value['blob']])
+        widgets.append(state)
+    base = blobs[info['base']] if info['base'] is not None else None
+    return Note(QSize(*info['page']), records, highlights, widgets, base)
@@ -0,0 +1,50 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+########### PyQT5 imports ###########
+from PyQt5 import QtGui
+from PyQt5.QtCore import Qt, QObject, QTimer, QElapsedTimer, pyqtSignal
+
+
+def screen_refresh_rate():
+    screen = QtGui.QGuiApplication.primaryScreen()
+    rate = screen.refreshRate() if screen is not None else 0
+    return rate if rate > 0 else 60
+
+
+class FrameScheduler(QObject):
+    # Collapses any number of requests into at most one `frame` signal per display frame
+    frame = pyqtSignal()
+
+    def __init__(self, fps=0, parent=None):
+        super(FrameScheduler, self).__init__(parent)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.flush)
+        self.last_frame = QElapsedTimer()
+        self.frame_count = 0
+        self.set_target_fps(fps)
+
+    def set_target_fps(self, fps):
+        # 0 means follow the refresh rate of the screen
+        self.fps = fps if fps > 0 else screen_refresh_rate()
+        self.interval = max(1, int(1000 / self.fps))
+
+    def request(self):
+        if self.timer.isActive():
+            return
+        # An idle canvas renders on the next loop iteration; a busy one waits for the next frame boundary
+        elapsed = self.last_frame.elapsed() if self.last_frame.isValid() else self.interval
+        self.timer.start(max(0, self.interval - elapsed))
+
+    def flush(self):
+        self.timer.stop()
+        self.last_frame.restart()
+        self.frame_count += 1
+        self.frame.emit()
@@ -0,0 +1,281 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+from collections import deque
+from itertools import chain
+
+from PyQt5.QtCore import QRect
+from PyQt5.QtGui import QImage
+
+from src.lotusIndex import QuadTree
+from src.lotusSurface import HighlightOverlay, TileJob
+
+
+class AddRecord:
+    # Only the vector record is kept; its pixels are rebuilt from the nearest checkpoint on undo
+    additive = True
+
+    def __init__(self, record):
+        self.record = record
+
+    def size(self):
+        return self.record.size()
+
+    def bounds(self):
+        return self.record.bounds()
+
+    def undo(self, canvas):
+        canvas.strokes.remove(self.record)
+        canvas.index.remove(self.record)
+        canvas.removeContent(self.record)
+        return self.record.bounds()
+
+    def redo(self, canvas):
+        canvas.surface.submit(self.record.bounds(), [self.record.paint])
+        canvas.place(self.record)
+        canvas.strokes.append(self.record)
+        canvas.addContent(self.record)
+        canvas.index.insert(self.record, self.record.bounds())
+        return self.record.bounds()
+
+
+class AddHighlight:
+    # Highlights live in their own overlay, so adding one never touches the ink tiles
+    additive = False
+
+    def __init__(self, record):
+        self.record = record
+
+    def size(self):
+        return self.record.size()
+
+    def bounds(self):
+        return self.record.bounds()
+
+    def undo(self, canvas):
+        canvas.overlay.remove(self.record)
+        canvas.removeContent(self.record)
+        return self.record.bounds()
+
+    def redo(self, canvas):
+        canvas.overlay.add(self.record)
+        canvas.addContent(self.record)
+        return self.record.bounds()
+
+
+class ClearAll:
+    # Clearing swaps out the whole tile dictionary, so undoing it is just swapping it back
+    additive = False
+
+    def __init__(self, canvas):
+        canvas.surface.settle()
+        self.records = canvas.strokes
+        self.overlay = canvas.overlay
+        self.tiles = canvas.surface.tiles
+        self.spilled = canvas.surface.spilled
+        self.pending = canvas.surface.pending
+        self.base_image = canvas.base_image
+        self.page_size = canvas.page_size
+        self.content_bounds = canvas.content_bounds
+        self.ink_records = canvas.ink_records
+        self.index = canvas.index
+
+    def size(self):
+        return sum(image.sizeInBytes() for image in self.tiles.values()) if self.tiles is not None else 0
+
+    def undo(self, canvas):
+        canvas.surface.settle()
+        canvas.strokes = self.records
+        canvas.overlay = self.overlay
+        canvas.surface.tiles = self.tiles
+        canvas.surface.spilled = self.spilled
+        canvas.surface.pending = self.pending
+        canvas.base_image = self.base_image
+        canvas.content_bounds = self.content_bounds
+        canvas.ink_records = self.ink_records
+        canvas.index = self.index
+        canvas.resizeCanvas(self.page_size)
+        self.tiles = None
+        return QRect()
+
+    def redo(self, canvas):
+        self.__init__(canvas)
+        canvas.strokes = []
+        canvas.overlay = HighlightOverlay()
+        canvas.surface.clear()
+        canvas.base_image = None
+        canvas.content_bounds = QRect()
+        canvas.ink_records = 0
+        canvas.index = QuadTree()
+        canvas.resizeCanvas(canvas.startSize)
+        return QRect()
+
+
+class EraseRecords:
+    # Erasing takes ink away, so it can't be replayed over a checkpoint; the area is rebuilt from the records instead
+    additive = False
+
+    def __init__(self, changes:list):
+        # (index, record, pieces) in the order they were applied to canvas.strokes
+        self.changes = changes
+
+    def size(self):
+        return sum(record.size() + sum(piece.size() for piece in pieces) for _, record, pieces in self.changes)
+
+    def bounds(self):
+        damaged = QRect()
+        for _, record, _ in self.changes:
+            damaged = damaged.united(record.bounds())
+        return damaged
+
+    def undo(self, canvas):
+        for index, record, pieces in reversed(self.changes):
+            canvas.replaceRecords(index, pieces, [record])
+        canvas.repaintRegion(self.bounds())
+        return self.bounds()
+
+    def redo(self, canvas):
+        for index, record, pieces in self.changes:
+            canvas.replaceRecords(index, [record], pieces)
+        canvas.repaintRegion(self.bounds())
+        return self.bounds()
+
+
+class UndoHistory:
+    def __init__(self, budget:int, interval:int):
+        self.budget = budget
+        self.interval = interval
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.serial = 0
+        # (serial, tiles) pairs: the surface as it was right after action `serial`
+        self.checkpoints = deque([(0, {})])
+        # Flattened actions newer than the oldest checkpoint, still replayed over it on undo
+        self.flattened = deque()
+        # Running byte totals of the actions kept and of the tiles only checkpoints hold, so push never walks the history
+        self.action_bytes = 0
+        self.held_bytes = 0
+        # Stands for the content below the undo stack; replaced whenever actions are flattened into it
+        self.base = object()
+        # Autosave journal every action is reported to, if any
+        self.journal = None
+
+    def can_undo(self):
+        return len(self.undo_stack) > 0
+
+    def can_redo(self):
+        return len(self.redo_stack) > 0
+
+    def state(self):
+        # Two equal states always mean identical content, so this doubles as the canvas's dirty flag
+        return self.undo_stack[-1] if len(self.undo_stack) > 0 else self.base
+
+    def checkpoint(self, surface):
+        # Shallow QImage copies share pixels until the live tile is painted on, so a checkpoint only costs what changes after it
+        # Tiles still being painted on the pool are checkpointed as their pending job, whose result is used once it's done
+        # Tiles of a loaded note that haven't been drawn yet are checkpointed as their records
+        tiles = dict(surface.spilled)
+        tiles.update({key: QImage(image) for key, image in surface.tiles.items()})
+        tiles.update(surface.jobs)
+        tiles.update(surface.pending)
+        self.checkpoints.append((self.serial, tiles))
+        if len(self.checkpoints) > 1:
+            self.held_bytes += self.held(self.checkpoints[-2][1], tiles)
+
+    def held(self, older:dict, newer:dict):
+        # Bytes only `older` holds: its tiles that were painted over before `newer` was taken
+        total = 0
+        for key, image in older.items():
+            if isinstance(image, QImage):
+                other = newer.get(key)
+                if not isinstance(other, QImage) or other.cacheKey() != image.cacheKey():
+                    total += image.sizeInBytes()
+        return total
+
+    def release(self, spilled:dict):
+        # Tiles the surface just wrote to disk are swapped for their spill reference wherever a checkpoint still shares them
+        for _, tiles in self.checkpoints:
+            for key, image in tiles.items():
+                if isinstance(image, TileJob) and image.ready.is_set() and image.result is not None:
+                    image = tiles[key] = image.result
+                if isinstance(image, QImage) and image.cacheKey() in spilled:
+                    tiles[key] = spilled[image.cacheKey()]
+        checkpoints = [tiles for _, tiles in self.checkpoints]
+        self.held_bytes = sum(self.held(older, newer) for older, newer in zip(checkpoints, checkpoints[1:]))
+
+    def size(self):
+        return self.action_bytes + self.held_bytes
+
+    def push(self, action, canvas, keep_redo=False):
+        if not keep_redo:
+            self.redo_stack.clear()
+            if self.journal is not None:
+                self.journal.record(action)
+        self.serial += 1
+        action.serial = self.serial
+        action.bytes = action.size()
+        self.action_bytes += action.bytes
+        self.undo_stack.append(action)
+        # Non-additive actions can't be replayed on top of a checkpoint, so the next window starts after them
+        if not action.additive or self.serial - self.checkpoints[-1][0] >= self.interval:
+            self.checkpoint(canvas.surface)
+        self.trim()
+
+    def trim(self):
+        # Oldest actions past the budget are flattened into the base: their ink stays, they just can't be undone anymore
+        while len(self.undo_stack) > 1 and self.size() > self.budget:
+            self.base = self.undo_stack.popleft()
+            self.flattened.append(self.base)
+            while len(self.checkpoints) > 1 and self.checkpoints[1][0] <= self.base.serial:
+                self.held_bytes -= self.held(self.checkpoints[0][1], self.checkpoints[1][1])
+                self.checkpoints.popleft()
+            # Once a checkpoint covers them, flattened actions are in its tiles and never needed again
+            while len(self.flattened) > 0 and self.flattened[0].serial <= self.checkpoints[0][0]:
+                self.action_bytes -= self.flattened.popleft().bytes
+
+    def undo(self, canvas):
+        action = self.undo_stack.pop()
+        self.action_bytes -= action.bytes
+        if self.journal is not None:
+            self.journal.undo()
+        while self.checkpoints[-1][0] >= action.serial:
+            self.held_bytes -= self.held(self.checkpoints[-2][1], self.checkpoints[-1][1])
+            self.checkpoints.pop()
+        self.serial = action.serial - 1
+        damaged = action.undo(canvas)
+        if action.additive:
+            # Restore the region from the nearest checkpoint, then replay at most `interval` actions over it, all on the worker pool
+            serial, tiles = self.checkpoints[-1]
+            window = []
+            for previous in chain(reversed(self.undo_stack), reversed(self.flattened)):
+                if previous.serial <= serial:
+                    break
+                if previous.bounds().intersects(damaged):
+                    window.append(previous.record.paint)
+            canvas.surface.submit(damaged, window[::-1], tiles)
+        self.redo_stack.append(action)
+        return damaged
+
+    def redo(self, canvas):
+        action = self.redo_stack.pop()
+        if self.journal is not None:
+            self.journal.redo()
+        damaged = action.redo(canvas)
+        self.push(action, canvas, keep_redo=True)
+        return damaged
+
+    def clear(self, surface):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.serial = 0
+        self.base = object()
+        self.flattened.clear()
+        self.action_bytes = 0
+        self.held_bytes = 0
+        self.checkpoints.clear()
+        self.checkpoint(surface)
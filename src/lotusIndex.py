@@ -0,0 +1,143 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+from operator import attrgetter
+
+########### PyQT5 imports ###########
+from PyQt5.QtCore import QRect
+
+
+def in_order(records):
+    # Records carry their place on the page in `order`, so k hits are put back in page order without the full list
+    return sorted(records, key=attrgetter('order'))
+
+
+def position(records:list, record):
+    # Index of record in a list kept in `order`, found by bisection
+    low, high = 0, len(records)
+    while low < high:
+        middle = (low + high) // 2
+        if records[middle].order < record.order:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class QuadNode:
+    __slots__ = ('rect', 'reach', 'items', 'children')
+
+    def __init__(self, rect:QRect):
+        self.rect = rect
+        # Anything stored here has its center in rect and is no larger than rect, so it stays inside reach
+        self.reach = rect.adjusted(-rect.width() // 2, -rect.height() // 2, rect.width() // 2, rect.height() // 2)
+        self.items = []
+        self.children = None
+
+
+class QuadTree:
+    # Loose quadtree: a record lives in the deepest node that holds its center and is at least as large as it,
+    # so records crossing a split line still sink down instead of piling up near the root
+    # The root doubles towards anything inserted outside of it, since the page can keep growing
+    def __init__(self, size=1024, capacity=8, max_depth=16):
+        self.capacity = capacity
+        self.max_depth = max_depth
+        self.root = QuadNode(QRect(0, 0, size, size))
+        self.nodes = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, item):
+        return item in self.nodes
+
+    def insert(self, item, rect:QRect):
+        if item in self.nodes:
+            self.remove(item)
+        # An empty rect is contained nowhere, so it would grow the root forever; index it as its 1x1 corner
+        rect = rect.normalized()
+        if rect.isEmpty():
+            rect = QRect(rect.x(), rect.y(), max(rect.width(), 1), max(rect.height(), 1))
+        while not self.root.rect.contains(rect):
+            self.grow(rect)
+        node = self.root
+        depth = 0
+        while True:
+            if node.children is None:
+                if len(node.items) < self.capacity or depth >= self.max_depth:
+                    break
+                self.split(node)
+            child = self.child_for(node, rect)
+            if child is None:
+                break
+            node = child
+            depth += 1
+        node.items.append((item, QRect(rect)))
+        self.nodes[item] = node
+
+    def remove(self, item):
+        node = self.nodes.pop(item, None)
+        if node is None:
+            return False
+        for index, (other, _) in enumerate(node.items):
+            if other == item:
+                del node.items[index]
+                break
+        return True
+
+    def query(self, rect:QRect):
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for item, bounds in node.items:
+                if bounds.intersects(rect):
+                    found.append(item)
+            if node.children is not None:
+                for child in node.children:
+                    if child.reach.intersects(rect):
+                        stack.append(child)
+        return found
+
+    def clear(self):
+        self.__init__(self.root.rect.width(), self.capacity, self.max_depth)
+
+    def child_for(self, node:QuadNode, rect:QRect):
+        center = rect.center()
+        for child in node.children:
+            if child.rect.contains(center):
+                if rect.width() <= child.rect.width() and rect.height() <= child.rect.height():
+                    return child
+                return None
+        return None
+
+    def quadrants(self, rect:QRect):
+        half_width = rect.width() // 2
+        half_height = rect.height() // 2
+        return [QRect(rect.x(), rect.y(), half_width, half_height),
+                QRect(rect.x() + half_width, rect.y(), rect.width() - half_width, half_height),
+                QRect(rect.x(), rect.y() + half_height, half_width, rect.height() - half_height),
+                QRect(rect.x() + half_width, rect.y() + half_height, rect.width() - half_width, rect.height() - half_height)]
+
+    def split(self, node:QuadNode):
+        node.children = [QuadNode(quadrant) for quadrant in self.quadrants(node.rect)]
+        items = node.items
+        node.items = []
+        for item, bounds in items:
+            child = self.child_for(node, bounds)
+            target = child if child is not None else node
+            target.items.append((item, bounds))
+            self.nodes[item] = target
+
+    def grow(self, rect:QRect):
+        old = self.root.rect
+        x = old.x() - old.width() if rect.left() < old.left() else old.x()
+        y = old.y() - old.height() if rect.top() < old.top() else old.y()
+        root = QuadNode(QRect(x, y, old.width() * 2, old.height() * 2))
+        root.children = [self.root if quadrant == old else QuadNode(quadrant) for quadrant in self.quadrants(root.rect)]
+        self.root = root
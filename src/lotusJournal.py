@@ -0,0 +1,291 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+import os
+import struct
+import threading
+import uuid
+import zlib
+
+########### PyQT5 imports ###########
+from PyQt5.QtCore import QLockFile, QSize
+
+from src.lotusFormat import Note, encode_body, decode_body, pack, unpack
+from src.lotusHistory import AddRecord, AddHighlight, ClearAll, EraseRecords
+from src.lotusStrokes import Highlight
+
+# File layout: header naming the file the entries apply on top of, then entries appended until the note is saved
+JOURNAL_SUFFIX = '.journal'
+LOCK_SUFFIX = '.lock'
+JOURNAL_MAGIC = b'LOTUSJ'
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct('<6sHI')
+# Payload length and CRC32 in front of every entry, so a write torn by a crash is dropped instead of misread
+ENTRY_HEADER = struct.Struct('<II')
+
+# Entry kinds
+ADD = 0
+HIGHLIGHT = 1
+ERASE = 2
+CLEAR = 3
+UNDO = 4
+REDO = 5
+WIDGETS = 6
+
+
+def encode_entry(kind:int, value):
+    # Records are encoded like a .lotus body holding just them, so an entry costs about as much as the ink it adds
+    if kind == ADD:
+        data = encode_body(Note(QSize(), [value], [], []))
+    elif kind == HIGHLIGHT:
+        data = encode_body(Note(QSize(), [], [value], []))
+    elif kind == ERASE:
+        meta = []
+        pieces = []
+        for index, highlight, new in value:
+            meta += [index, highlight, len(new)]
+            pieces += new
+        data = pack(meta) + encode_body(Note(QSize(), pieces, [], []))
+    elif kind == WIDGETS:
+        data = encode_body(Note(QSize(), [], [], value))
+    else:
+        data = b''
+    payload = bytes([kind]) + data
+    return ENTRY_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_entry(payload):
+    kind = payload[0]
+    data = payload[1:]
+    if kind == ADD:
+        return kind, decode_body(data).records[0]
+    if kind == HIGHLIGHT:
+        return kind, decode_body(data).highlights[0]
+    if kind == ERASE:
+        meta, offset = unpack(data)
+        pieces = decode_body(data[offset:]).records
+        changes = []
+        meta = meta.tolist()
+        for index in range(0, len(meta), 3):
+            count = meta[index + 2]
+            changes.append((meta[index], bool(meta[index + 1]), pieces[:count]))
+            pieces = pieces[count:]
+        return kind, changes
+    if kind == WIDGETS:
+        return kind, decode_body(data).widgets
+    return kind, None
+
+
+def read_journal(path:str):
+    # Returns the base file path (None for a note that was never saved), the entries, and the length of the intact part
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < JOURNAL_HEADER.size:
+        return None, [], 0
+    magic, version, base_length = JOURNAL_HEADER.unpack_from(data)
+    if magic != JOURNAL_MAGIC or version > JOURNAL_VERSION:
+        raise ValueError("Not a Lotus journal")
+    offset = JOURNAL_HEADER.size + base_length
+    base = data[JOURNAL_HEADER.size:offset].decode('utf-8') or None
+    entries = []
+    while offset + ENTRY_HEADER.size <= len(data):
+        length, checksum = ENTRY_HEADER.unpack_from(data, offset)
+        payload = data[offset + ENTRY_HEADER.size:offset + ENTRY_HEADER.size + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break
+        entries.append(decode_entry(payload))
+        offset += ENTRY_HEADER.size + length
+    return base, entries, offset
+
+
+def lock_journal(path:str):
+    # Held for as long as a journal is live, so other running instances leave it alone; None if one of them holds it
+    # A lock left behind by a process that died is taken over however old it is, since the age check is off
+    lock = QLockFile(path + LOCK_SUFFIX)
+    lock.setStaleLockTime(0)
+    return lock if lock.tryLock(0) else None
+
+
+def unsaved_journals(directory:str):
+    # (path, lock) of journals left behind by notes that were neither saved nor discarded; empty ones are cleaned up on the way
+    # Journals still held by a running instance are skipped; the caller releases the locks of the ones returned
+    journals = []
+    if not os.path.isdir(directory):
+        return journals
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(JOURNAL_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        lock = lock_journal(path)
+        if lock is None:
+            continue
+        try:
+            _, entries, _ = read_journal(path)
+        except (OSError, ValueError):
+            entries = []
+        if len(entries) > 0:
+            journals.append((path, lock))
+        else:
+            os.remove(path)
+            lock.unlock()
+    return journals
+
+
+class Journal:
+    # Append-only log of what was done to a note since it was last saved
+    # The GUI thread only queues actions; encoding, writing and fsync happen in batches on the journal's own thread
+    def __init__(self, directory:str, interval:int, path:str=None, base:str=None, length:int=None):
+        self.directory = directory
+        self.path = path if path is not None else os.path.join(directory, uuid.uuid4().hex + JOURNAL_SUFFIX)
+        # Seconds to keep collecting entries before a batch is written and synced
+        self.interval = interval / 1000
+        self.base = base
+        # Intact length of an existing journal that is being continued, e.g. after recovering it
+        self.length = length
+        self.file = None
+        # Number of entries queued so far, and the (number, bytes) of the entries in the file that this session wrote
+        self.count = 0
+        self.entries = []
+        self.queue = []
+        self.condition = threading.Condition()
+        self.closing = threading.Event()
+        self.thread = None
+        os.makedirs(directory, exist_ok=True)
+        self.lock = lock_journal(self.path)
+
+    def record(self, action):
+        if isinstance(action, AddRecord):
+            self.put(ADD, action.record)
+        elif isinstance(action, AddHighlight):
+            self.put(HIGHLIGHT, action.record)
+        elif isinstance(action, EraseRecords):
+            self.put(ERASE, [(index, isinstance(record, Highlight), pieces) for index, record, pieces in action.changes])
+        elif isinstance(action, ClearAll):
+            self.put(CLEAR)
+
+    def undo(self):
+        self.put(UNDO)
+
+    def redo(self):
+        self.put(REDO)
+
+    def widgets(self, states:list):
+        self.put(WIDGETS, states)
+
+    def mark(self):
+        # Position to hand back to reset() once everything before it is safely in a file
+        return self.count
+
+    def reset(self, base:str=None, mark:int=None):
+        # Entries before mark (all of them by default) are in the saved or loaded file now, so the log starts over on top of it
+        self.put(None, (base, self.count if mark is None else mark))
+
+    def put(self, kind, value=None):
+        with self.condition:
+            if kind is not None:
+                self.count += 1
+            self.queue.append((kind, value, self.count))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while len(self.queue) == 0 and not self.closing.is_set():
+                    self.condition.wait()
+            if len(self.queue) == 0:
+                break
+            # Whatever else arrives in the meantime goes out with the same write and sync
+            self.closing.wait(self.interval)
+            with self.condition:
+                batch = self.queue
+                self.queue = []
+            self.write(batch)
+
+    def write(self, batch:list):
+        data = []
+        for kind, value, number in batch:
+            if kind is None:
+                self.write_out(data)
+                data = []
+                self.compact(*value)
+            else:
+                data.append((number, encode_entry(kind, value)))
+        self.write_out(data)
+
+    def write_out(self, data:list):
+        if len(data) == 0:
+            return
+        if self.file is None:
+            self.open()
+        self.file.write(b''.join(entry for _, entry in data))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.entries += data
+
+    def compact(self, base:str, mark:int):
+        # Entries made while a save was running stay; they go into a new journal that replaces this one in one rename
+        self.base = base
+        kept = [(number, entry) for number, entry in self.entries if number > mark]
+        if len(kept) == 0:
+            self.drop()
+            return
+        self.file.close()
+        self.length = None
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as file:
+            file.write(self.header() + b''.join(entry for _, entry in kept))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.path)
+        self.file = open(self.path, 'ab')
+        self.entries = kept
+
+    def open(self):
+        if self.length is not None:
+            # Continues an existing journal, cutting off a torn last entry first
+            self.file = open(self.path, 'r+b')
+            self.file.truncate(self.length)
+            self.file.seek(self.length)
+            self.length = None
+            return
+        self.file = open(self.path, 'wb')
+        self.file.write(self.header())
+
+    def header(self):
+        base = (self.base or '').encode('utf-8')
+        return JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, len(base)) + base
+
+    def drop(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.length = None
+        self.entries = []
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self, discard=True):
+        # A saved or discarded note has nothing left to recover; otherwise what's queued is written out and the file kept
+        with self.condition:
+            if discard:
+                self.queue = []
+            self.closing.set()
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        if discard:
+            self.drop()
+        elif self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.lock is not None:
+            self.lock.unlock()
+            self.lock = None
@@ -0,0 +1,309 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+import math
+import threading
+
+########### PyQT5 imports ###########
+from PyQt5.QtCore import Qt, QBuffer, QByteArray, QCoreApplication, QIODevice, QObject, QPoint, QRect, QRectF, QSize, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QColor, QImageIOHandler, QImageReader, QPainter, QPen
+
+from src.lotusSurface import mip_level
+
+# Size of the low-resolution copy of the whole image shown wherever full bands haven't been decoded yet;
+# images no bigger than this are simply decoded whole
+PREVIEW_PIXELS = 1 << 20
+
+# Band job keys besides (band, level)
+PREVIEW = 'preview'
+WHOLE = 'whole'
+
+
+def image_reader(source):
+    # source is a file path, or the encoded bytes when the image came embedded in a .lotus note
+    if not isinstance(source, bytes):
+        return QImageReader(source)
+    buffer = QBuffer()
+    buffer.setData(QByteArray(source))
+    buffer.open(QIODevice.ReadOnly)
+    reader = QImageReader(buffer)
+    # The reader doesn't own its device
+    reader.buffer = buffer
+    return reader
+
+
+class BandSignals(QObject):
+    # Lives on the GUI thread, so a band decoded on a worker is picked up there through a queued connection
+    finished = pyqtSignal()
+
+
+class BandJob:
+    # Decodes rect of the image (all of it for None) at size in a worker thread, with a reader of its own
+    def __init__(self, key, source, rect:QRect, size:QSize, signals:BandSignals):
+        self.key = key
+        self.source = source
+        self.rect = rect
+        self.size = size
+        self.signals = signals
+        self.result = None
+        # Set once the band is no longer wanted, so a job still waiting in the queue is skipped
+        self.cancelled = False
+        self.ready = threading.Event()
+
+    def run(self):
+        try:
+            if self.cancelled:
+                return
+            reader = image_reader(self.source)
+            if self.rect is not None:
+                reader.setClipRect(self.rect)
+            if self.size is not None:
+                reader.setScaledSize(self.size)
+            self.result = reader.read()
+        finally:
+            self.ready.set()
+            self.signals.finished.emit()
+
+
+class PageImage:
+    # A note image opened from disk, decoded one page band at a time through QImageReader's clip rect
+    # Given landed(rect), decoding happens on the worker pool instead: a preview of the whole image first, then the bands of
+    # the kept pages, visible ones first; landed is called on the GUI thread as each one arrives
+    # Decoding has threads of its own: Qt's smooth scaling splits large images across the global pool and waits for them,
+    # so that pool must never be stuck behind a decode that is itself scaling
+    pool = None
+
+    def __init__(self, source, page_height:int, landed=None):
+        self.source = source
+        self.page_height = page_height
+        self.bands = {}
+        # (band, level) -> band decoded at 1 / 2 ** level of its size; small enough to keep for every page
+        self.mips = {}
+        self.whole = None
+        self.preview = None
+        # Pages whose bands stay decoded, in the order they were asked for
+        self.kept = []
+        self.landed = landed
+        self.jobs = {}
+        reader = image_reader(source)
+        self._size = reader.size()
+        # Formats that can't decode a region (e.g. PNG would decode everything for every band) are decoded whole, once
+        self.regions = self._size.width() * self._size.height() > PREVIEW_PIXELS and reader.supportsOption(QImageIOHandler.ClipRect)
+        if not self._size.isValid() or (landed is None and not self.regions):
+            # Formats that can't report their size up front are decoded whole right away
+            self.whole = image_reader(source).read()
+            self._size = self.whole.size()
+        elif landed is not None:
+            if PageImage.pool is None:
+                PageImage.pool = QThreadPool()
+                # Nothing still queued is worth decoding once Lotus is closing
+                QCoreApplication.instance().aboutToQuit.connect(PageImage.pool.clear)
+                QCoreApplication.instance().aboutToQuit.connect(PageImage.pool.waitForDone)
+            self.signals = BandSignals()
+            self.signals.finished.connect(self.collect)
+            self.request(PREVIEW if self.regions else WHOLE)
+
+    def size(self):
+        return QSize(self._size)
+
+    def rect(self):
+        return QRect(QPoint(0, 0), self._size)
+
+    def isNull(self):
+        return self._size.isEmpty()
+
+    def band(self, index:int, keep=True):
+        # None while the band is still being decoded on the pool; when streaming, only kept pages are decoded at all
+        image = self.bands.get(index)
+        if image is None:
+            if self.streaming():
+                if index in self.kept or not self.regions:
+                    self.request((index, 0) if self.regions else WHOLE)
+                return None
+            image = self.decode(index, 0)
+            if keep:
+                self.bands[index] = image
+        return image
+
+    def band_mip(self, index:int, level:int):
+        image = self.mips.get((index, level))
+        if image is None:
+            if self.streaming():
+                self.request((index, level) if self.regions else WHOLE)
+                return None
+            image = self.decode(index, level)
+            self.mips[(index, level)] = image
+        return image
+
+    def streaming(self):
+        return self.landed is not None and self.whole is None
+
+    def band_rect(self, index:int):
+        return QRect(0, index * self.page_height, self._size.width(), self.page_height).intersected(self.rect())
+
+    def band_size(self, index:int, level:int):
+        rect = self.band_rect(index)
+        return QSize(max(1, rect.width() >> level), max(1, rect.height() >> level))
+
+    def decode(self, index:int, level:int):
+        rect = self.band_rect(index)
+        size = self.band_size(index, level)
+        if self.whole is not None:
+            image = self.whole.copy(rect)
+            return image if level == 0 else image.scaled(size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        # Lets the decoder skip everything outside the band, and decode JPEGs straight at the reduced size
+        reader = image_reader(self.source)
+        reader.setClipRect(rect)
+        if level > 0:
+            reader.setScaledSize(size)
+        return reader.read()
+
+    def request(self, key):
+        if key in self.jobs:
+            return
+        if key == PREVIEW:
+            factor = math.sqrt(PREVIEW_PIXELS / (self._size.width() * self._size.height()))
+            rect, size = None, QSize(max(1, int(self._size.width() * factor)), max(1, int(self._size.height() * factor)))
+        elif key == WHOLE:
+            rect, size = None, None
+        else:
+            rect, size = self.band_rect(key[0]), (self.band_size(*key) if key[1] > 0 else None)
+        job = BandJob(key, self.source, rect, size, self.signals)
+        self.jobs[key] = job
+        self.pool.start(job.run)
+
+    def collect(self):
+        for key, job in list(self.jobs.items()):
+            if not job.ready.is_set():
+                continue
+            del self.jobs[key]
+            if job.result is None or job.result.isNull():
+                continue
+            if key == PREVIEW:
+                self.preview = job.result
+                rect = self.rect()
+            elif key == WHOLE:
+                self.whole = job.result
+                rect = self.rect()
+            else:
+                index, level = key
+                if level > 0:
+                    self.mips[key] = job.result
+                elif index in self.kept:
+                    self.bands[index] = job.result
+                else:
+                    # Scrolled away from before it was done
+                    continue
+                rect = self.band_rect(index)
+            self.landed(rect)
+
+    def keep(self, pages):
+        # Decodes the given bands, in order, and lets go of every other one
+        self.kept = [index for index in pages if index * self.page_height < self._size.height()]
+        for index in list(self.bands):
+            if index not in self.kept:
+                del self.bands[index]
+        for key, job in list(self.jobs.items()):
+            if key not in (PREVIEW, WHOLE) and key[1] == 0 and key[0] not in self.kept:
+                job.cancelled = True
+                del self.jobs[key]
+        if self.whole is not None or not self.regions:
+            return
+        for index in self.kept:
+            self.band(index)
+
+    def paint(self, painter:QPainter, rect:QRect, scale=1.0):
+        rect = rect.intersected(self.rect())
+        if rect.isEmpty():
+            return
+        level = mip_level(scale)
+        if self.whole is not None and level == 0:
+            painter.drawImage(rect, self.whole, rect)
+            return
+        for index in range(rect.top() // self.page_height, rect.bottom() // self.page_height + 1):
+            band_rect = self.band_rect(index)
+            source = rect.intersected(band_rect)
+            local = source.translated(-band_rect.topLeft())
+            # Unless streaming, bands outside the kept pages are decoded for this paint only, e.g. when the whole note is saved
+            image = self.band(index, keep=False) if level == 0 else self.band_mip(index, level)
+            if image is None:
+                self.paint_preview(painter, source)
+                continue
+            x_factor = image.width() / band_rect.width()
+            y_factor = image.height() / band_rect.height()
+            painter.drawImage(QRectF(source), image, QRectF(local.x() * x_factor, local.y() * y_factor, local.width() * x_factor, local.height() * y_factor))
+
+    def paint_preview(self, painter:QPainter, rect:QRect):
+        if self.preview is None:
+            return
+        x_factor = self.preview.width() / self._size.width()
+        y_factor = self.preview.height() / self._size.height()
+        painter.save()
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+        painter.drawImage(QRectF(rect), self.preview, QRectF(rect.x() * x_factor, rect.y() * y_factor, rect.width() * x_factor, rect.height() * y_factor))
+        painter.restore()
+
+
+class Notebook:
+    # Splits the canvas into fixed-height pages; only the visible pages and their neighbours keep pixels in memory
+    def __init__(self, page_height:int, neighbours=1):
+        self.page_height = max(1, page_height)
+        self.neighbours = neighbours
+        self.resident = range(0)
+
+    def page_of(self, y:int):
+        return max(0, y) // self.page_height
+
+    def pages_for(self, rect:QRect):
+        return range(self.page_of(rect.top()), self.page_of(rect.bottom()) + 1)
+
+    def page_rect(self, index:int, width:int):
+        return QRect(0, index * self.page_height, width, self.page_height)
+
+    def page_count(self, height:int):
+        return max(1, -(-height // self.page_height))
+
+    def round_up(self, height:int):
+        return self.page_count(height) * self.page_height
+
+    def show(self, canvas, rect:QRect):
+        # Pages leaving the neighbourhood of rect are spilled to disk, pages entering it are brought back
+        visible = self.pages_for(rect)
+        resident = range(max(0, visible.start - self.neighbours), visible.stop + self.neighbours)
+        if resident == self.resident:
+            return
+        self.resident = resident
+        surface = canvas.surface
+        top = resident.start * self.page_height
+        bottom = resident.stop * self.page_height
+        keep = set(surface.keys_for(QRect(0, top, max(canvas.page_size.width(), 1), bottom - top)))
+        released = surface.spill([key for key in surface.tiles if key not in keep])
+        if len(released) > 0:
+            canvas.history.release(released)
+        for key in keep:
+            if key in surface.spilled:
+                surface.load(key)
+        # Pages of a loaded note are only drawn from their records once they come this close
+        surface.realize(sorted(keep, key=lambda key: self.page_of(surface.tile_rect(key).top()) not in visible))
+        if canvas.base_image is not None:
+            # The visible pages are decoded first
+            canvas.base_image.keep(list(visible) + [index for index in resident if index not in visible])
+
+    def reset(self):
+        self.resident = range(0)
+
+    def paint_breaks(self, painter:QPainter, rect:QRect):
+        # On-screen only: a thin line where one page ends and the next begins
+        painter.save()
+        painter.setClipRect(rect)
+        painter.setPen(QPen(QColor(200, 200, 200), 0, Qt.DashLine))
+        for index in range(max(1, -(-rect.top() // self.page_height)), rect.bottom() // self.page_height + 1):
+            # Drawn from x = 0 so the dashes line up however the line is split across repaints
+            y = index * self.page_height
+            painter.drawLine(0, y, rect.right(), y)
+        painter.restore()
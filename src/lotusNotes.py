@@ -8,21 +8,54 @@
 
 import configparser
 import json
+import math
 ########### PyQT5 imports ###########
 import os
+from collections import OrderedDict
+from itertools import count
 from datetime import date
 from enum import Enum
 import pytesseract
 from PIL import Image
 from PyQt5 import QtCore, QtGui, QtWidgets
-from PyQt5.QtCore import Qt, pyqtSignal, QSize, QPoint, QRect
+from PyQt5.QtCore import Qt, pyqtSignal, QSize, QPoint, QPointF, QRect, QRectF, QThreadPool
 from PyQt5.QtGui import QRegion, QColor, QPainter, QIcon, QPixmap
 from PyQt5.QtWidgets import QPushButton, QWidget, QLabel, QMessageBox, QScrollArea, QGridLayout, QHBoxLayout, \
     QVBoxLayout, QSizePolicy, QAction
 
-from src.constants import CONFIG_FILE, DIRECTORY_FILE, SCHEDULE_FILE_PATH, SCHEDULED_NOTES_DIRECTORY, assets
+from src.constants import CONFIG_FILE, DIRECTORY_FILE, JOURNAL_DIRECTORY, SCHEDULE_FILE_PATH, SCHEDULED_NOTES_DIRECTORY, assets
 from src.lotusButtons import ToolButton
-from src.lotusFloating import FloatingWidget
+from src.lotusFloating import FloatingWidget, restore_widget
+from src.lotusFormat import NOTE_SUFFIX, WIDTH_SCALE, Note, read_note
+from src.lotusFrames import FrameScheduler
+from src.lotusIndex import QuadTree, in_order, position
+from src.lotusNotebook import Notebook, PageImage
+from src.lotusEraser import erased_segments, split_stroke
+from src.lotusHistory import UndoHistory, AddRecord, AddHighlight, ClearAll, EraseRecords
+from src.lotusJournal import Journal, read_journal, ADD, HIGHLIGHT, ERASE, CLEAR, UNDO, REDO, WIDGETS
+from src.lotusSave import SaveSignals, PageSnapshot, SaveJob, first_page
+from src.lotusSimplify import simplify_stroke, thin_samples
+from src.lotusStrokes import Stroke, Highlight, Stamp
+from src.lotusSurface import TiledSurface, HighlightOverlay, PendingTile, TILE_SIZE, mip_level
+
+# Extra page kept composited around the viewport so small scrolls never touch the tiles
+VIEWPORT_MARGIN = TILE_SIZE // 2
+
+# Pixel paints the background over ink, Stroke removes every stroke it touches, Partial cuts strokes where it passes
+ERASER_MODES = ('Pixel', 'Stroke', 'Partial')
+
+# Slack around the live stroke overlay so it isn't reallocated on every move
+LIVE_MARGIN = 64
+
+# Zoom range of the canvas, as a factor of page pixels to screen pixels
+MIN_ZOOM = 0.125
+MAX_ZOOM = 4.0
+# Zoom steps multiply up rounding error, so a zoom this close to 100% is taken as exactly 100%
+ZOOM_SNAP = 1e-3
+
+# Paper sizes in inches, reserved up front so a normal page of notes never has to grow
+PAGE_SIZES = {'A4': (8.27, 11.69),
+              'LETTER': (8.5, 11.0)}
 
 def default_config():
     os.makedirs(SCHEDULED_NOTES_DIRECTORY, exist_ok=True)
@@ -37,7 +70,19 @@ def default_config():
                              'Name_Heading': 'True',
                              'Default_Font': 'Sans Serif',
                              'Default_Style': 'Normal',
-                             'Default_Font_Size': '12'}
+                             'Default_Font_Size': '12',
+                             'Undo_Budget_MB': '64',
+                             'Undo_Checkpoint_Interval': '16',
+                             'Target_FPS': '0',
+                             'Page_Size': 'Letter',
+                             'Page_DPI': '96',
+                             'Page_Growth_Factor': '1.5',
+                             'Page_Growth_Cap': '2048',
+                             'Eraser_Mode': 'Partial',
+                             'Stroke_Min_Distance': '2',
+                             'Stroke_Tolerance': '0.75',
+                             'Stroke_Smoothing': 'False',
+                             'Autosave_Interval_MS': '500'}
         config.write(file)
     file.close()
 
@@ -56,6 +101,62 @@ def eraser_size():
 def highlighter_size():
     return 30
 
+def undo_budget():
+    default_config()
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    return int(config['DEFAULT'].get('undo_budget_mb', '64')) * 1024 * 1024
+
+def undo_checkpoint_interval():
+    default_config()
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    return int(config['DEFAULT'].get('undo_checkpoint_interval', '16'))
+
+def target_fps():
+    default_config()
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    return int(config['DEFAULT'].get('target_fps', '0'))
+
+def eraser_mode():
+    default_config()
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    mode = config['DEFAULT'].get('eraser_mode', 'Partial').capitalize()
+    return mode if mode in ERASER_MODES else 'Pixel'
+
+def page_reserve_size():
+    default_config()
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    inches = PAGE_SIZES.get(config['DEFAULT'].get('page_size', 'Letter').upper())
+    if inches is None:
+        return QSize(0, 0)
+    dpi = int(config['DEFAULT'].get('page_dpi', '96'))
+    return QSize(int(inches[0] * dpi), int(inches[1] * dpi))
+
+def page_growth():
+    default_config()
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    return max(1.0, float(config['DEFAULT'].get('page_growth_factor', '1.5'))), int(config['DEFAULT'].get('page_growth_cap', '2048'))
+
+def stroke_filter():
+    # Minimum distance between captured samples, RDP tolerance applied at pen-up (both in px), and Catmull-Rom smoothing
+    default_config()
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    return float(config['DEFAULT'].get('stroke_min_distance', '2')), float(config['DEFAULT'].get('stroke_tolerance', '0.75')), \
+           config['DEFAULT'].get('stroke_smoothing', 'False').lower() == 'true'
+
+def autosave_interval():
+    # Longest time in ms that new ink waits before it is synced to the autosave journal
+    default_config()
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    return max(1, int(config['DEFAULT'].get('autosave_interval_ms', '500')))
+
 def set_default_pen_width(width):
     Utensils.PEN.radius = width
 
@@ -85,6 +186,10 @@ class Utensil:
         result = self.radius - 1
         self.radius = result if result >= self.minWidth else self.minWidth
 
+    def pressure_width(self, pressure : float):
+        # Kept to the precision notes store widths at, so a saved note draws exactly as it did
+        return round(max(1.0, self.radius * pressure) * WIDTH_SCALE) / WIDTH_SCALE
+
     def pen(self):
         pen = QtGui.QPen()
         pen.setStyle(self.brush_style)
@@ -105,25 +210,91 @@ class Utensils(Utensil, Enum):
     ERASER = (Qt.white, eraser_size())
     HIGHLIGHTER = (QColor(248, 222, 126, 80), highlighter_size(), Qt.NoPen, Qt.SquareCap, Qt.MiterJoin, Qt.SolidPattern)
 
+class CursorCache:
+    # Scaled tool cursors keyed by (radius, device pixel ratio); the source image is read from disk once
+    def __init__(self, path, capacity=32):
+        self.source = QtGui.QImage(path)
+        self.capacity = capacity
+        self.cursors = OrderedDict()
+
+    def cursor(self, radius:int, ratio:float):
+        key = (radius, ratio)
+        cursor = self.cursors.get(key)
+        if cursor is not None:
+            self.cursors.move_to_end(key)
+            return cursor
+        side = max(1, round(radius * ratio))
+        pixmap = QPixmap.fromImage(self.source.scaled(QSize(side, side), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        pixmap.setDevicePixelRatio(ratio)
+        cursor = QtGui.QCursor(pixmap)
+        self.cursors[key] = cursor
+        if len(self.cursors) > self.capacity:
+            self.cursors.popitem(last=False)
+        return cursor
+
+pen_eraser_cursors = CursorCache(assets["pen_eraser_cursor"])
+
 class Canvas(QLabel):
     layer_change = pyqtSignal()
     scrolled = pyqtSignal(QtGui.QWheelEvent)
     mouse_grab = pyqtSignal(QPoint)
+    zoomed = pyqtSignal(float, QPoint)
+    # Percent done of the save in progress, then (path, error message or "") once the file is in place
+    save_progress = pyqtSignal(int)
+    saved = pyqtSignal(str, str)
     def __init__(self):
         super(Canvas, self).__init__()
+        # Records and tiles are in page coordinates; the widget shows them scaled by zoom
+        self.zoom = 1.0
+        # Set while a zoom change resizes the widget, which must not be taken for the window growing
+        self.zooming = False
+        self.grabGesture(Qt.PinchGesture)
         self.setStyleSheet("background-color: black")
-        master_canvas_layer = QtGui.QPixmap(self.size())
-        master_canvas_layer.fill(Qt.white)
-        self.activeLayers = []
-        self.activeLayers.append(master_canvas_layer)
-        self.inactiveLayers = []
+        self.surface = TiledSurface()
+        # Tiles repainted on the worker pool are put on screen as they come back
+        self.surface.landed = self.refresh
+        reserve = page_reserve_size()
+        self.page_size = self.size().expandedTo(reserve)
+        # Off-screen pages are spilled to disk and come back as they are scrolled to
+        self.notebook = Notebook(reserve.height() if reserve.height() > 0 else 4 * TILE_SIZE)
+        self.growth_factor, self.growth_cap = page_growth()
+        # Number of times the page has been resized, to keep an eye on the growth policy
+        self.resize_count = 0
+        self.base_image = None
+        self.strokes = []
+        # Highlights are composited below the ink instead of being painted into it
+        self.overlay = HighlightOverlay()
+        # Number of records that leave ink; with no page image, zero means the page is blank
+        self.ink_records = 0
+        # Union of everything that leaves ink on the page, None once something was taken off and it has to be recomputed
+        self.content_bounds = QRect()
+        # Spatial index over record bounds for hit-testing, erasing and selection
+        self.index = QuadTree()
+        # Numbers records as they join the page; never restarts, so records kept by the history still sort correctly
+        self.sequence = count()
+        self.history = UndoHistory(undo_budget(), undo_checkpoint_interval())
+        # Every action is logged to disk as it happens, so a crash loses at most one autosave interval of work
+        self.journal = Journal(JOURNAL_DIRECTORY, autosave_interval())
+        self.history.journal = self.journal
         self.floatingWidgets = []
+        # widget -> (widget position, page position) as of the last zoom, so zooming back and forth never drifts a widget
+        self.widget_anchors = {}
         #self.canvasLayers = [master_canvas_layer] # Deprecated
         #self.activeLayers = [True] # Deprecated
         # self.numLayers = 1 # Deprecated
         # self.activePointer = 1 # Deprecated
-        self.last_save = None
-        self.setPixmap(self.activeLayers[0])
+        # Page size Clear All goes back to
+        self.startSize = QSize(self.page_size)
+        # Identity of the history state that was last saved, so "unsaved changes" never needs pixel comparisons
+        self.saved_state = self.history.state()
+        # Floating widget states as of the last native save; widgets stay live widgets in a .lotus note
+        self.saved_widgets = []
+        # Floating widgets change outside the undo history, so their state is compared and journaled on a timer
+        self.journaled_widgets = []
+        self.journal_timer = QtCore.QTimer(self)
+        self.journal_timer.timeout.connect(self.journalWidgets)
+        self.journal_timer.start(autosave_interval())
+        self.setMinimumSize(self.page_size)
         ########### Writing parameters ###########
         # General utensil parameters
         self.utensil_press = False
@@ -134,6 +305,33 @@ class Canvas(QLabel):
         self.pen_lastPoint = QtCore.QPoint()
         # Eraser default parameters
         self.eraser_lastPoint = QtCore.QPoint()
+        # Input samples (position, width, timestamp) are buffered and drawn once per display frame
+        # Composited copy of the visible part of the page plus a prefetch margin; paintEvent only blits from it
+        self.viewport_rect = QRect()
+        self.view_rect = QRect()
+        self.view_cache = None
+        # The stroke being drawn lives in a small overlay the size of its bounding box until pen-up
+        self.live_stroke = None
+        self.live_image = None
+        self.live_rect = QRect()
+        # (image, rect) overlays of finished strokes whose tiles are still being painted on a worker
+        self.landing = []
+        self.min_distance, self.simplify_tolerance, self.smoothing = stroke_filter()
+        # Newest sample dropped for being too close to the last point, added at pen-up so the stroke ends where the pen did
+        self.held_sample = None
+        self.eraser_mode = eraser_mode()
+        self.erase_changes = []
+        # (position, width) samples waiting for the next frame; pressure is already mapped to width by the utensil
+        self.pending_samples = []
+        self.frame_scheduler = FrameScheduler(target_fps(), self)
+        self.frame_scheduler.frame.connect(self.flushSamples)
+        # Saves are encoded on their own single worker so they land in the order they were made, without holding up the tile pool
+        self.save_pool = QThreadPool(self)
+        self.save_pool.setMaxThreadCount(1)
+        self.save_signals = SaveSignals()
+        self.save_signals.progress.connect(self.saveProgress)
+        self.save_signals.finished.connect(self.collectSaves)
+        self.save_jobs = []
         self.cursor_update()
         #self.cursor_pix_scaled = QPixmap(assets["pen_eraser_cursor"]).scaled(QSize(self.current_utensil.radius, self.current_utensil.radius), Qt.KeepAspectRatio, Qt.SmoothTransformation)
         #self.cursor = QtGui.QCursor(self.cursor_pix_scaled)
@@ -159,73 +357,289 @@ class Canvas(QLabel):
 
     def cursor_update(self):
         if not self.current_utensil == Utensils.HIGHLIGHTER:
-            cursor_pixmap = QPixmap(assets["pen_eraser_cursor"]).scaled(QSize(self.current_utensil.radius, self.current_utensil.radius), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            cursor = QtGui.QCursor(cursor_pixmap)
-            self.setCursor(cursor)
+            self.setCursor(pen_eraser_cursors.cursor(max(1, round(self.current_utensil.radius * self.zoom)), self.devicePixelRatioF()))
         else:
             cursor = QtGui.QCursor()
             cursor.setShape(Qt.CrossCursor)
             self.setCursor(cursor)
 
 
-    def resizeLayer(self, i, size, active=True):
-        temp = self.activeLayers[i] if active else self.inactiveLayers[i]
-        if temp.size() == size:
-            return
-        if active:
-            self.activeLayers[i] = QtGui.QPixmap(size)
-            self.activeLayers[i].fill(Qt.transparent if i != 0 else Qt.white)
-            self.layer_painter.begin(self.activeLayers[i])
-        else:
-            temp = self.inactiveLayers[i]
-            self.inactiveLayers[i] = QtGui.QPixmap(size)
-            self.inactiveLayers[i].fill(Qt.transparent)
-            self.layer_painter.begin(self.inactiveLayers[i])
-        self.layer_painter.drawPixmap(temp.rect(), temp, temp.rect())
-        self.layer_painter.end()
-
     def resizeCanvas(self, size):
-        temp = self.activeLayers[0]
-        self.activeLayers[0] = QtGui.QPixmap(size)
-        self.activeLayers[0].fill(Qt.white)
-        self.painter = QtGui.QPainter(self.activeLayers[0])
-        self.painter.drawPixmap(self.activeLayers[0].rect(), temp, temp.rect())
-        self.painter.end()
-        self.setPixmap(self.activeLayers[0])
+        # Tiles are allocated on first ink, so growing the page never copies pixels
+        if size != self.page_size:
+            self.resize_count += 1
+        self.page_size = QSize(size)
+        self.setMinimumSize(self.toWidgetRect(QRect(QPoint(0, 0), size)).size())
+        self.update()
 
-        for i in range (0, len(self.activeLayers)):
-            self.resizeLayer(i, self.size())
+    def resizeEvent(self, event: QtGui.QResizeEvent) -> None:
+        self.view_rect = QRect()
+        self.setViewport(self.viewport_rect)
+        # Only at 100% does a larger window mean a larger page; zooming out shouldn't add paper
+        if self.zoom == 1 and not self.zooming and self.page_size != self.size():
+            self.resizeCanvas(self.size().expandedTo(self.page_size))
+
+    def toPage(self, pos):
+        if self.zoom == 1:
+            return QPoint(pos)
+        return QPoint(round(pos.x() / self.zoom), round(pos.y() / self.zoom))
+
+    def toPageRect(self, rect:QRect):
+        if self.zoom == 1:
+            return QRect(rect)
+        left = math.floor(rect.x() / self.zoom)
+        top = math.floor(rect.y() / self.zoom)
+        return QRect(left, top, math.ceil((rect.x() + rect.width()) / self.zoom) - left, math.ceil((rect.y() + rect.height()) / self.zoom) - top)
+
+    def toWidgetRect(self, rect:QRect):
+        if self.zoom == 1:
+            return QRect(rect)
+        return QRectF(rect.x() * self.zoom, rect.y() * self.zoom, rect.width() * self.zoom, rect.height() * self.zoom).toAlignedRect()
+
+    def setZoom(self, zoom:float):
+        zoom = min(MAX_ZOOM, max(MIN_ZOOM, zoom))
+        if abs(zoom - 1) < ZOOM_SNAP:
+            zoom = 1.0
+        if zoom == self.zoom:
+            return
+        # Floating widgets stay anchored to their page position; they keep their own size, which is also their size on the page
+        anchors = {widget: self.widgetPagePos(widget) for widget in self.floatingWidgets}
+        self.zoom = zoom
+        for widget, page_pos in anchors.items():
+            widget.move(round(page_pos.x() * zoom), round(page_pos.y() * zoom))
+        self.widget_anchors = {widget: (widget.pos(), page_pos) for widget, page_pos in anchors.items()}
+        # The scroll area resizes the widget on its next layout pass, which is run here while zooming is set
+        self.zooming = True
+        self.setMinimumSize(self.toWidgetRect(QRect(QPoint(0, 0), self.page_size)).size())
+        QtCore.QCoreApplication.sendPostedEvents(None, QtCore.QEvent.LayoutRequest)
+        self.zooming = False
+        self.cursor_update()
+        self.view_rect = QRect()
+        self.notebook.reset()
+        self.setViewport(self.viewport_rect)
+        self.update()
 
-        if self.last_save is None:
-            self.startSize = self.size()
-            self.last_save = self.activeLayers[0].toImage()
+    def event(self, event: QtCore.QEvent) -> bool:
+        if event.type() == QtCore.QEvent.Gesture:
+            pinch = event.gesture(Qt.PinchGesture)
+            if pinch is not None:
+                if pinch.changeFlags() & QtWidgets.QPinchGesture.ScaleFactorChanged:
+                    self.zoomed.emit(pinch.scaleFactor(), self.mapFromGlobal(pinch.centerPoint().toPoint()))
+                return True
+        elif event.type() == QtCore.QEvent.NativeGesture and event.gestureType() == Qt.ZoomNativeGesture:
+            # Trackpad pinch on macOS
+            self.zoomed.emit(1 + event.value(), event.pos())
+            return True
+        return super(Canvas, self).event(event)
+
+    def grownLength(self, length, needed):
+        # Geometric growth up to the cap, so a long page is resized a logarithmic number of times
+        if needed <= length:
+            return length
+        step = max(100, min(self.growth_cap, int(length * (self.growth_factor - 1))))
+        return max(needed, length + step)
+
+    def growForPoints(self, points):
+        # Keep at least 200 px of page past the furthest sample
+        width = self.grownLength(self.page_size.width(), max(pos.x() for pos in points) + 200)
+        height = self.grownLength(self.page_size.height(), max(pos.y() for pos in points) + 200)
+        height = self.notebook.round_up(height) if height != self.page_size.height() else height
+        if width != self.page_size.width() or height != self.page_size.height():
+            self.resizeCanvas(QSize(width, height))
+
+    def erasing(self):
+        return self.current_utensil == Utensils.ERASER and self.eraser_mode != 'Pixel'
+
+    def beginStroke(self, pos, width=None):
+        self.utensil_press = True
+        if self.erasing():
+            self.erase_changes = []
+            self.eraseAlong(pos, pos)
+        elif not self.current_utensil == Utensils.HIGHLIGHTER:
+            stroke = Stroke(self.current_utensil.name, self.current_utensil.color, self.current_utensil.radius, width is not None)
+            stroke.add_point(pos, width)
+            self.live_stroke = stroke
+            self.live_image = None
+            self.held_sample = None
+            self.refresh(self.drawLive(0))
+        self.last_point_draw = pos
+
+    def extendStroke(self, samples):
+        # Draws a batch of (position, width) samples into the live overlay in one pass
+        self.growForPoints([pos for pos, width in samples])
+        if self.current_utensil == Utensils.HIGHLIGHTER:
+            return
+        if self.erasing():
+            for pos, width in samples:
+                self.eraseAlong(self.last_point_draw, pos)
+                self.last_point_draw = pos
+            return
+        stroke = self.live_stroke
+        first = stroke.point_count()
+        kept, held = thin_samples(stroke.last_point(), samples, self.min_distance)
+        for pos, width in kept:
+            stroke.add_point(pos, width)
+        if len(kept) > 0 or held is not None:
+            self.held_sample = held
+        self.last_point_draw = samples[-1][0]
+        if stroke.point_count() > first:
+            self.refresh(self.drawLive(first))
+
+    def drawLive(self, first):
+        # Draws the live stroke from point first on and returns the damaged rect
+        stroke = self.live_stroke
+        bounds = stroke.bounds()
+        if self.live_image is None or not self.live_rect.contains(bounds):
+            rect = bounds.adjusted(-LIVE_MARGIN, -LIVE_MARGIN, LIVE_MARGIN, LIVE_MARGIN)
+            if self.live_image is not None:
+                rect = rect.united(self.live_rect)
+            image = QtGui.QImage(rect.size(), QtGui.QImage.Format_ARGB32_Premultiplied)
+            image.fill(Qt.transparent)
+            if self.live_image is not None:
+                self.painter.begin(image)
+                self.painter.drawImage(self.live_rect.topLeft() - rect.topLeft(), self.live_image)
+                self.painter.end()
+            self.live_image = image
+            self.live_rect = rect
+        self.painter.begin(self.live_image)
+        self.painter.setRenderHint(QPainter.Antialiasing, True)
+        # Source mode keeps translucent ink from building up where consecutive segments overlap
+        self.painter.setCompositionMode(QPainter.CompositionMode_Source)
+        self.painter.translate(-self.live_rect.x(), -self.live_rect.y())
+        stroke.paint_range(self.painter, first)
+        self.painter.end()
+        if first == 0:
+            return bounds
+        damaged = QRect()
+        for index in range(first, stroke.point_count()):
+            damaged = damaged.united(stroke.segment_bounds(index))
+        return damaged
+
+    def commitLive(self):
+        # Pen-up: the finished stroke is painted into the tiles once on a worker, exactly as undo and redo will replay it
+        # Its overlay stays on screen until the tiles have it, so nothing flickers in between
+        stroke = self.live_stroke
+        if self.held_sample is not None:
+            stroke.add_point(*self.held_sample)
+            self.held_sample = None
+        # What is kept is simplified to within simplify_tolerance of what was drawn, and optionally smoothed
+        stroke = simplify_stroke(stroke, self.simplify_tolerance)
+        if self.smoothing:
+            stroke.smoothen()
+        landing = (self.live_image, self.live_rect)
+        self.landing.append(landing)
+        self.live_stroke = None
+        self.live_image = None
+        self.live_rect = QRect()
+        self.surface.submit(stroke.bounds(), [stroke.paint], done=lambda rect: self.landing.remove(landing))
+        self.place(stroke)
+        self.strokes.append(stroke)
+        return stroke
+
+    def paintLive(self, painter:QPainter, rect:QRect):
+        for image, live_rect in self.landing + [(self.live_image, self.live_rect)]:
+            if image is not None and live_rect.intersects(rect):
+                source = rect.intersected(live_rect)
+                painter.drawImage(source, image, source.translated(-live_rect.topLeft()))
+
+    def endStroke(self, pos):
+        if self.current_utensil == Utensils.HIGHLIGHTER:
+            highlight = Highlight(QRect(self.last_point_draw, pos), self.current_utensil.color)
+            # A click or a drag released beside its start covers no area
+            if not highlight.rect.isEmpty():
+                action = AddHighlight(highlight)
+                self.refresh(action.redo(self))
+                self.history.push(action, self)
+        elif self.erasing():
+            if len(self.erase_changes) > 0:
+                self.history.push(EraseRecords(self.erase_changes), self)
+            self.erase_changes = []
+        elif self.live_stroke is not None:
+            stroke = self.commitLive()
+            self.addContent(stroke)
+            self.index.insert(stroke, stroke.bounds())
+            self.history.push(AddRecord(stroke), self)
+        self.layer_change.emit()
+        self.utensil_press = False
 
-    def resizeEvent(self, event: QtGui.QResizeEvent) -> None:
-        if self.activeLayers[0].size() != self.size():
-            self.resizeCanvas(self.size())
+    def eraseAlong(self, start, end):
+        # Only records the spatial index puts near the eraser path are tested, all their segments at once
+        radius = self.current_utensil.radius
+        area = QRect(start, end).normalized().adjusted(-radius, -radius, radius, radius)
+        damaged = QRect()
+        for record in self.overlay.records_in(area):
+            index = position(self.overlay.records, record)
+            self.replaceRecords(index, [record], [])
+            self.erase_changes.append((index, record, []))
+            damaged = damaged.united(record.bounds())
+        for record in self.recordsIn(area):
+            if isinstance(record, Stroke) and record.utensil != Utensils.ERASER.name:
+                erased = erased_segments(record, start, end, radius)
+                if not erased.any():
+                    continue
+                pieces = split_stroke(record, erased, start, end, radius) if self.eraser_mode == 'Partial' else []
+            else:
+                continue
+            index = position(self.strokes, record)
+            self.replaceRecords(index, [record], pieces)
+            self.erase_changes.append((index, record, pieces))
+            damaged = damaged.united(record.bounds())
+        if not damaged.isEmpty():
+            self.repaintRegion(damaged)
+            self.refresh(damaged)
+
+    def replaceRecords(self, index, old, new):
+        for record in old:
+            self.removeContent(record)
+        for record in new:
+            self.addContent(record)
+        if isinstance((old + new)[0], Highlight):
+            self.overlay.replace(index, old, new)
+            return
+        # Pieces split off a stroke take its place in the order
+        for number, record in enumerate(new):
+            if record.order is None:
+                record.order = old[0].order + (number,)
+        self.strokes[index:index + len(old)] = new
+        for record in old:
+            self.index.remove(record)
+        for record in new:
+            self.index.insert(record, record.bounds())
+
+    def repaintRegion(self, rect:QRect):
+        # Rebuilds rect from the records under it, for when ink is taken away
+        self.surface.submit(rect, [record.paint for record in self.recordsIn(rect)], {})
+
+    def cycleEraserMode(self):
+        self.eraser_mode = ERASER_MODES[(ERASER_MODES.index(self.eraser_mode) + 1) % len(ERASER_MODES)]
+
+    def queueSample(self, pos, width):
+        self.pending_samples.append((pos, width))
+        self.frame_scheduler.request()
+
+    def flushSamples(self):
+        if len(self.pending_samples) > 0 and self.utensil_press:
+            self.extendStroke(self.pending_samples)
+        self.pending_samples = []
+
+    def tabletEvent(self, event: QtGui.QTabletEvent) -> None:
+        width = self.current_utensil.pressure_width(event.pressure())
+        if event.type() == QtCore.QEvent.TabletPress and event.button() == Qt.LeftButton:
+            self.beginStroke(self.toPage(event.pos()), width)
+        elif event.type() == QtCore.QEvent.TabletMove and self.utensil_press:
+            self.queueSample(self.toPage(event.pos()), width)
+        elif event.type() == QtCore.QEvent.TabletRelease and self.utensil_press:
+            self.flushSamples()
+            self.endStroke(self.toPage(event.pos()))
+        else:
+            # Lets Qt synthesize a mouse event instead, e.g. for middle-button scrolling
+            event.ignore()
+            return
+        event.accept()
 
     def mousePressEvent(self, event: QtGui.QMouseEvent) -> None:
         if event.button() == Qt.LeftButton:
-            self.utensil_press = True
-            # self.numLayers += 1
-            new_canvas_layer = QtGui.QPixmap(self.size())
-            new_canvas_layer.fill(Qt.transparent)
-
-            self.painter.begin(new_canvas_layer)
-            self.painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
-            self.painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, True)
-            self.painter.setPen(self.current_utensil.pen())
-            self.painter.drawPoint(event.pos())
-
-            self.activeLayers.append(new_canvas_layer)
-            self.inactiveLayers.clear()
-
-            self.paintMirrorEvent()
-            self.layer_change.emit()
-
-            self.last_point_draw = event.pos()
-            ##self.update()
-            self.painter.end()
+            self.beginStroke(self.toPage(event.pos()))
         elif event.button() == Qt.MiddleButton:
             self.setCursor(Qt.ClosedHandCursor)
             self.last_point_scroll = event.globalPos()
@@ -235,28 +649,7 @@ class Canvas(QLabel):
 
     def mouseMoveEvent(self, event: QtGui.QMouseEvent) -> None:
         if event.buttons() and Qt.LeftButton and self.utensil_press:
-            x = self.width() - event.pos().x()
-            y = self.height() - event.pos().y()
-            if x < 200:
-                if y < 200:
-                    self.resizeLayer(-1, QSize(self.width() + 100, self.height() + 100))
-                    self.resizeCanvas(QSize(self.width() + 100, self.height()))
-                else:
-                    self.resizeLayer(-1, QSize(self.width() + 100, self.height()))
-                    self.resizeCanvas(QSize(self.width() + 100, self.height()))
-            elif y < 200:
-                self.resizeLayer(-1, QSize(self.width(), self.height() + 100))
-                self.resizeCanvas(QSize(self.width(), self.height() + 100))
-            self.painter.begin(self.activeLayers[len(self.activeLayers) - 1])
-            self.painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
-            self.painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, True)
-            self.painter.setPen(self.current_utensil.pen())
-            if not self.current_utensil == Utensils.HIGHLIGHTER:
-                self.painter.drawLine(self.last_point_draw, event.pos())
-                self.last_point_draw = event.pos()
-            ##self.update()
-            self.paintMirrorEvent()
-            self.painter.end()
+            self.queueSample(self.toPage(event.pos()), None)
         elif event.buttons() and Qt.MiddleButton and self.mouse_button_scrolling:
             offset = self.last_point_scroll - event.globalPos()
             self.last_point_scroll = event.globalPos()
@@ -265,19 +658,9 @@ class Canvas(QLabel):
             super(Canvas, self).mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event: QtGui.QMouseEvent) -> None:
-        if event.button() == Qt.LeftButton:
-            if self.current_utensil == Utensils.HIGHLIGHTER:
-                self.painter.begin(self.activeLayers[len(self.activeLayers) - 1])
-                self.painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
-                self.painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, True)
-                self.painter.setPen(self.current_utensil.pen())
-                self.painter.setBrush(self.current_utensil.highlighter())
-                self.painter.drawRect(self.last_point_draw.x(), self.last_point_draw.y(), (event.pos().x() -self.last_point_draw.x()), (event.pos().y() -self.last_point_draw.y()))
-                ##self.update()
-                self.painter.end()
-            self.paintMirrorEvent()
-            self.layer_change.emit()
-            self.utensil_press = False
+        if event.button() == Qt.LeftButton and self.utensil_press:
+            self.flushSamples()
+            self.endStroke(self.toPage(event.pos()))
 
         elif event.button() == Qt.MiddleButton:
             self.cursor_update()
@@ -373,18 +756,145 @@ class Canvas(QLabel):
     #         self.mouse_button_scrolling = False
 
     def wheelEvent(self, event: QtGui.QWheelEvent) -> None:
-        self.scrolled.emit(event)
+        if event.modifiers() & Qt.ControlModifier:
+            self.zoomed.emit(1.25 ** (event.angleDelta().y() / 120), event.pos())
+        else:
+            self.scrolled.emit(event)
 
     def paintMirrorEvent(self):
-        self.layer_painter.begin(self.activeLayers[0])
-        self.layer_painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
-        self.layer_painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, True)
-        # print(len(self.activeLayers))
-        self.layer_painter.drawPixmap(self.activeLayers[0].rect(), self.activeLayers[len(self.activeLayers) - 1])
-        # for i in range(1, len(self.activeLayers)):
-        #    self.layer_painter.drawPixmap(self.activeLayers[0].rect(), self.activeLayers[i])
-        self.layer_painter.end()
-        self.setPixmap(self.activeLayers[0])
+        self.refresh()
+
+    def setViewport(self, rect:QRect):
+        # Called by CanvasWindow whenever the visible part of the page moves
+        self.viewport_rect = QRect(rect)
+        if rect.isEmpty():
+            return
+        self.notebook.show(self, self.residentRect())
+        if self.view_rect.contains(rect):
+            return
+        self.view_rect = rect.adjusted(-VIEWPORT_MARGIN, -VIEWPORT_MARGIN, VIEWPORT_MARGIN, VIEWPORT_MARGIN).intersected(self.rect())
+        self.view_cache = QPixmap(self.view_rect.size())
+        self.refresh()
+
+    def residentRect(self):
+        # Page rect whose pages keep full tiles in memory
+        if mip_level(self.zoom) > 0:
+            # Zoomed out the page is drawn from mips, so only the pages around the center need full tiles
+            return self.toPageRect(QRect(self.viewport_rect.center(), QSize(1, 1)))
+        return self.toPageRect(self.viewport_rect)
+
+    def refresh(self, rect:QRect=None):
+        # Re-composites a page rect into the view cache; anything outside the cache waits until it is scrolled to
+        rect = self.view_rect if rect is None else self.toWidgetRect(rect).intersected(self.view_rect)
+        if rect.isEmpty():
+            if self.view_cache is None:
+                self.update()
+            return
+        painter = QPainter(self.view_cache)
+        painter.translate(-self.view_rect.topLeft())
+        self.compose(painter, rect)
+        painter.end()
+        self.update(rect)
+
+    def compose(self, painter:QPainter, rect:QRect):
+        # rect is in widget coordinates; everything is drawn in page coordinates through the zoom
+        painter.save()
+        painter.setClipRect(rect)
+        if self.zoom != 1:
+            painter.scale(self.zoom, self.zoom)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+        page_rect = self.toPageRect(rect)
+        self.surface.render(painter, page_rect, underlay=self.paintUnderlay, scale=self.zoom)
+        self.paintLive(painter, page_rect)
+        self.notebook.paint_breaks(painter, page_rect)
+        painter.restore()
+
+    def paintUnderlay(self, painter:QPainter, rect:QRect, scale=1.0):
+        # Everything below the ink: a loaded page image, then the highlights
+        if self.base_image is not None:
+            self.base_image.paint(painter, rect, scale)
+        self.overlay.paint(painter, rect)
+
+    def paintEvent(self, event: QtGui.QPaintEvent) -> None:
+        painter = QPainter(self)
+        rect = event.rect()
+        if self.view_cache is not None and self.view_rect.contains(rect):
+            painter.drawPixmap(rect, self.view_cache, rect.translated(-self.view_rect.topLeft()))
+        else:
+            self.compose(painter, rect)
+        painter.end()
+
+    def commitRecord(self, record):
+        action = AddRecord(record)
+        self.refresh(action.redo(self))
+        self.history.push(action, self)
+
+    def addContent(self, record):
+        # Eraser strokes only paint the background back, so they never make the page non-blank
+        if record.utensil != Utensils.ERASER.name:
+            self.ink_records += 1
+            if self.content_bounds is not None:
+                self.content_bounds = self.content_bounds.united(record.bounds())
+
+    def removeContent(self, record):
+        if record.utensil != Utensils.ERASER.name:
+            self.ink_records -= 1
+            self.content_bounds = None
+
+    def updateContentBounds(self):
+        # Only walks the record bounds, never the pixels; needed after the records were replaced wholesale
+        self.ink_records = 0
+        self.content_bounds = self.base_image.rect() if self.base_image is not None else QRect()
+        for record in self.strokes:
+            self.addContent(record)
+        for record in self.overlay.records:
+            self.addContent(record)
+
+    def contentBounds(self):
+        if self.content_bounds is None:
+            self.updateContentBounds()
+        return self.content_bounds
+
+    def isBlank(self):
+        return self.ink_records == 0 and self.base_image is None
+
+    def place(self, record):
+        if record.order is None:
+            record.order = (next(self.sequence),)
+
+    def recordsIn(self, rect:QRect):
+        # Records whose bounds touch rect, oldest first so they can be repainted in order
+        return in_order(self.index.query(rect))
+
+    def rasterize(self):
+        # Rebuild the backing store from the vector records
+        extent = QRect(QPoint(0, 0), self.page_size)
+        self.surface.clear()
+        if self.base_image is not None:
+            extent = extent.united(self.base_image.rect())
+        self.index = QuadTree()
+        for record in self.strokes:
+            self.place(record)
+            extent = extent.united(record.bounds())
+            self.index.insert(record, record.bounds())
+        # Each tile only remembers the records that touch it; it is drawn on the worker pool once its page comes near the view
+        for key in self.surface.keys_for(extent):
+            tile_rect = self.surface.tile_rect(key)
+            records = self.recordsIn(tile_rect)
+            if len(records) > 0:
+                self.surface.pending[key] = PendingTile(tile_rect, [record.paint for record in records])
+        if extent.size() != self.page_size:
+            self.resizeCanvas(extent.size())
+        self.updateContentBounds()
+        self.paintMirrorEvent()
+
+    def canvasImage(self):
+        # The page exactly as an export would write it, whatever has streamed in so far
+        return self.snapshot().image()
+
+    def snapshot(self, rect:QRect=None):
+        return PageSnapshot(self.surface, self.page_size, self.notebook.page_height,
+                            self.base_image.source if self.base_image is not None else None, list(self.overlay.records), rect)
 
     # def paintEvent(self, event):
     #     #self.activeLayers[0].fill(Qt.white)
@@ -411,25 +921,20 @@ class Canvas(QLabel):
     #     super(Canvas, self).paintEvent(event)
 
     def hasChanged(self):
-        if self.last_save is None:
-            return False
-        if len(self.floatingWidgets) > 0:
+        if self.widgetStates() != self.saved_widgets:
             return True
         # elif len(self.floatingWidgets) == 1 and not self.floatingWidgets[0].is_heading:
         #     return True
-        return not self.pixmap().toImage() == self.last_save
+        return self.history.state() is not self.saved_state
+
+    def widgetPagePos(self, widget):
+        pos, page_pos = self.widget_anchors.get(widget, (None, None))
+        if pos != widget.pos():
+            page_pos = QPointF(widget.x() / self.zoom, widget.y() / self.zoom)
+        return page_pos
 
     def floatingWidgetPlace(self, widget):
-        new_floating_canvas_layer = QtGui.QPixmap(self.size())
-        new_floating_canvas_layer.fill(Qt.transparent)
-        self.painter.begin(new_floating_canvas_layer)
-        self.painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
-        self.painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, True)
-        self.painter.drawPixmap(widget.geometry().x(), widget.geometry().y(), widget.grab())
-        self.activeLayers.append(new_floating_canvas_layer)
-        self.painter.end()
-        ##self.update()
-        self.paintMirrorEvent()
+        self.commitRecord(Stamp(self.widgetPagePos(widget).toPoint(), widget.grab().toImage()))
         #widget.deleteLater()
         widget.to_delete = True
         self.floatingWidgetDelete(widget)
@@ -444,11 +949,73 @@ class Canvas(QLabel):
                 return
 
     def save(self, file_path):
-        for i in self.floatingWidgets:
-             self.floatingWidgetPlace(i)
-        self.floatingWidgets.clear()
-        self.activeLayers[0].save(file_path)
-        self.last_save = self.activeLayers[0].toImage()
+        # Only a snapshot is taken here; the file is encoded and written on a worker while writing goes on
+        if file_path.lower().endswith(NOTE_SUFFIX):
+            note = self.noteState()
+            # A note stores its records; only the thumbnail is drawn from tiles
+            rect = first_page(self.page_size, self.notebook.page_height)
+        else:
+            # JPG/PNG export flattens everything, floating widgets included
+            for i in self.floatingWidgets:
+                 self.floatingWidgetPlace(i)
+            self.floatingWidgets.clear()
+            note = None
+            rect = None
+            if self.base_image is not None and self.base_image.source == file_path:
+                # The export replaces the page image's own file, which still has to be drawn under the ink
+                with open(file_path, 'rb') as file:
+                    self.base_image.source = file.read()
+        job = SaveJob(file_path, self.snapshot(rect), note, self.history.state(), note.widgets if note is not None else [],
+                      self.journal.mark(), self.save_signals)
+        self.save_jobs.append(job)
+        self.save_pool.start(job.run)
+
+    def collectSaves(self):
+        # Saves land in order; a failed one leaves the note marked as changed
+        while len(self.save_jobs) > 0 and self.save_jobs[0].ready.is_set():
+            job = self.save_jobs.pop(0)
+            if job.error is None:
+                self.saved_state = job.state
+                self.saved_widgets = job.widgets
+                # What the file now holds is dropped from the journal; anything done during the save stays in it
+                self.journal.reset(job.path, job.mark)
+            self.saved.emit(job.path, job.error or "")
+
+    def saveProgress(self, percent):
+        # Progress queued behind a save that waitForSaves() already landed is stale
+        if len(self.save_jobs) > 0:
+            self.save_progress.emit(percent)
+
+    def waitForSaves(self):
+        for job in list(self.save_jobs):
+            job.ready.wait()
+        self.collectSaves()
+
+    def noteState(self):
+        # Committed records are never changed in place, so copying the lists is enough of a snapshot
+        return Note(self.page_size, list(self.strokes), list(self.overlay.records), self.widgetStates(),
+                    self.base_image.source if self.base_image is not None else None)
+
+    def journalWidgets(self):
+        if len(self.floatingWidgets) == 0 and len(self.journaled_widgets) == 0:
+            return
+        states = self.widgetStates()
+        if states != self.journaled_widgets:
+            self.journaled_widgets = states
+            self.journal.widgets(states)
+
+    def widgetStates(self):
+        # Visible floating widgets, positioned in page coordinates
+        states = []
+        for widget in self.floatingWidgets:
+            if widget.isHidden():
+                continue
+            state = widget.state()
+            if state is not None:
+                pos = self.widgetPagePos(widget).toPoint()
+                state['x'], state['y'] = pos.x(), pos.y()
+                states.append(state)
+        return states
 
     def setUtensil(self, utensil : Utensil):
         self.current_utensil = utensil
@@ -456,71 +1023,131 @@ class Canvas(QLabel):
     # Button click handling
     def clear(self):
         # Reset canvas
-        clear_canvas_layer = QtGui.QPixmap(self.size())
-        clear_canvas_layer.fill(Qt.white)
-        self.activeLayers.append(clear_canvas_layer)
-        self.inactiveLayers.clear()
+        action = ClearAll(self)
+        action.redo(self)
+        self.history.push(action, self)
+        self.showPages()
         self.paintMirrorEvent()
-        self.resizeCanvas(self.startSize)
         self.layer_change.emit()
         # Reset back to pen tool (done outside)
         # self.setUtensil(Utensils.PEN)
 
-    def change_master_layer(self):
-        self.activeLayers[0].fill(Qt.white)
-        self.layer_painter.begin(self.activeLayers[0])
-        self.layer_painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
-        self.layer_painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, True)
-        for i in range(1, len(self.activeLayers)):
-            self.layer_painter.drawPixmap(self.activeLayers[0].rect(), self.activeLayers[i])
-        self.layer_painter.end()
-        self.setPixmap(self.activeLayers[0])
-
-
     def undo(self):
-        if len(self.activeLayers) > 1:
-            #self.activeLayers[0] = self.activeLayers[0] or self.activeLayers[len(self.activeLayers) - 1]
-            #mask = self.activeLayers[len(self.activeLayers) - 1].createMaskFromColor()
-
-            # self.layer_painter.begin(self.activeLayers[0])
-            # self.layer_painter.setCompositionMode(QPainter.RasterOp_SourceXorDestination)
-            # self.layer_painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
-            # self.layer_painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, True)
-            # self.layer_painter.drawPixmap(self.activeLayers[0].rect(), self.activeLayers[len(self.activeLayers) - 1])
-            # #self.layer_painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
-            # self.layer_painter.end()
-            # self.setPixmap(self.activeLayers[0])
-
-            #self.update()
-            #self.activeLayers[0].begin(self.activeLayers[0])
-
-            self.inactiveLayers.append(self.activeLayers.pop())
-            self.change_master_layer()
-            self.paintMirrorEvent()
+        if self.history.can_undo():
+            damaged = self.history.undo(self)
+            # Undo and redo may have pulled spilled tiles back in anywhere on the page
+            self.showPages()
+            if damaged.isEmpty():
+                self.paintMirrorEvent()
+            else:
+                self.refresh(damaged)
             self.layer_change.emit()
-        #self.update()
 
     def redo(self): # Now finishing command pattern
-        if len(self.inactiveLayers) > 0:
-            self.activeLayers.append(self.inactiveLayers.pop())
-            self.paintMirrorEvent()
+        if self.history.can_redo():
+            damaged = self.history.redo(self)
+            self.showPages()
+            if damaged.isEmpty():
+                self.paintMirrorEvent()
+            else:
+                self.refresh(damaged)
             self.layer_change.emit()
-        #self.update()
+
+    def showPages(self):
+        # Re-derives which pages are in memory, e.g. after Clear All swapped the whole surface
+        self.notebook.reset()
+        if not self.viewport_rect.isEmpty():
+            self.notebook.show(self, self.residentRect())
 
     def loadImage(self, file_path):
-        image_pixmap = QtGui.QPixmap(file_path)
-        canvas = QtGui.QPixmap(self.minimumSize().expandedTo(image_pixmap.size()))
-        blank = QtGui.QPixmap(canvas.size())
-        blank.fill(Qt.white)
-        self.activeLayers = [blank, canvas]
-        self.inactiveLayers.clear()
-        self.painter.begin(canvas)
-        self.painter.drawPixmap(canvas.rect(), image_pixmap, image_pixmap.rect())
-        self.painter.end()
-        self.resizeCanvas(self.activeLayers[0].size())
+        self.waitForSaves()
+        # Only the image header is read here; the pixels stream in on the worker pool, visible pages first
+        self.base_image = PageImage(file_path, self.notebook.page_height, self.refresh)
+        self.strokes.clear()
+        self.overlay = HighlightOverlay()
+        self.resizeCanvas(self.page_size.expandedTo(self.base_image.size()))
+        self.rasterize()
+        self.showPages()
+        self.history.clear(self.surface)
+        self.saved_state = self.history.state()
+        self.journal.reset(file_path)
+        self.journaled_widgets = self.widgetStates()
+
+    def loadNote(self, file_path):
+        self.waitForSaves()
+        note = read_note(file_path)
+        self.base_image = PageImage(note.base, self.notebook.page_height, self.refresh) if note.base is not None else None
+        self.strokes = note.records
+        self.overlay = HighlightOverlay()
+        for record in note.highlights:
+            self.overlay.add(record)
+        self.resizeCanvas(self.page_size.expandedTo(note.page_size))
+        self.rasterize()
+        self.showPages()
+        self.history.clear(self.surface)
+        self.saved_state = self.history.state()
+        self.setWidgets(note.widgets)
+        self.saved_widgets = self.widgetStates()
+        self.journal.reset(file_path)
+        self.journaled_widgets = self.saved_widgets
+
+    def setWidgets(self, states:list):
+        for widget in self.floatingWidgets:
+            widget.deleteLater()
+        self.floatingWidgets = []
+        self.widget_anchors = {}
+        for state in states:
+            widget = restore_widget(state, self)
+            widget.move(round(state['x'] * self.zoom), round(state['y'] * self.zoom))
+            self.widget_anchors[widget] = (widget.pos(), QPointF(state['x'], state['y']))
+            self.floatingWidgets.append(widget)
+            widget.show()
+
+    def recover(self, journal_path):
+        # Reopens the file the journal was started on and replays the unsaved actions over it, undo history included
+        base, entries, length = read_journal(journal_path)
+        if base is not None and os.path.isfile(base):
+            if base.lower().endswith(NOTE_SUFFIX):
+                self.loadNote(base)
+            else:
+                self.loadImage(base)
+        else:
+            base = None
+        self.journal.close()
+        self.history.journal = None
+        # The same journal keeps growing, so a second crash before saving loses nothing either
+        self.journal = Journal(JOURNAL_DIRECTORY, autosave_interval(), journal_path, base, length)
+        for kind, value in entries:
+            if kind == ADD:
+                self.commitRecord(value)
+            elif kind == HIGHLIGHT:
+                action = AddHighlight(value)
+                action.redo(self)
+                self.history.push(action, self)
+            elif kind == ERASE:
+                changes = []
+                for index, highlight, pieces in value:
+                    record = (self.overlay.records if highlight else self.strokes)[index]
+                    self.replaceRecords(index, [record], pieces)
+                    changes.append((index, record, pieces))
+                action = EraseRecords(changes)
+                self.repaintRegion(action.bounds())
+                self.history.push(action, self)
+            elif kind == CLEAR:
+                self.clear()
+            elif kind == UNDO:
+                self.undo()
+            elif kind == REDO:
+                self.redo()
+            elif kind == WIDGETS:
+                self.setWidgets(value)
+        self.history.journal = self.journal
+        self.journaled_widgets = self.widgetStates()
+        extent = QRect(QPoint(0, 0), self.page_size).united(self.contentBounds())
+        if extent.size() != self.page_size:
+            self.resizeCanvas(extent.size())
         self.paintMirrorEvent()
-        ##self.update()
-        self.last_save = self.activeLayers[0].toImage()
+        return base
 
 class CanvasWindow(QScrollArea):
     def __init__(self):
@@ -529,6 +1156,7 @@ class CanvasWindow(QScrollArea):
         self.layout = QVBoxLayout()
         self.label = Canvas()
         self.label.scrolled.connect(self.scrollForLabel)
+        self.label.zoomed.connect(self.zoomAt)
         self.label.mouse_grab.connect(self.mouseGrabScroll)
         self.layout.setContentsMargins(0,0,0,0)
         self.layout.setAlignment(Qt.AlignTop)
@@ -538,6 +1166,30 @@ class CanvasWindow(QScrollArea):
         self.setLayout(self.layout)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
+        self.horizontalScrollBar().valueChanged.connect(self.updateViewport)
+        self.verticalScrollBar().valueChanged.connect(self.updateViewport)
+
+    def updateViewport(self):
+        self.label.setViewport(QRect(-self.label.pos(), self.viewport().size()))
+
+    def resizeEvent(self, event: QtGui.QResizeEvent) -> None:
+        super(CanvasWindow, self).resizeEvent(event)
+        self.updateViewport()
+
+    def zoomAt(self, factor:float, pos:QPoint):
+        # Zooms by factor keeping the page point under pos (in canvas coordinates) where it is on screen
+        anchor = pos + self.label.pos()
+        page_x = pos.x() / self.label.zoom
+        page_y = pos.y() / self.label.zoom
+        # setZoom has the scroll area pick up the new size, so the scroll bars already have their new range
+        self.label.setZoom(self.label.zoom * factor)
+        self.horizontalScrollBar().setValue(round(page_x * self.label.zoom - anchor.x()))
+        self.verticalScrollBar().setValue(round(page_y * self.label.zoom - anchor.y()))
+        self.updateViewport()
+
+    def zoomCenter(self, factor:float):
+        center = QPoint(self.viewport().width() // 2, self.viewport().height() // 2) - self.label.pos()
+        self.zoomAt(factor, center)
 
     def mouseGrabScroll(self, offset):
         x = self.horizontalScrollBar().value() + offset.x()
@@ -570,7 +1222,7 @@ class CanvasWindow(QScrollArea):
 class UINoteWindow(QWidget):
     deleted_file = pyqtSignal(str)
 
-    def __init__(self, schedule, file_path:str, parent=None, scheduled=False):
+    def __init__(self, schedule, file_path:str, parent=None, scheduled=False, recover:str=None):
         super(UINoteWindow, self).__init__(parent)
         self.schedule = schedule
         self.file_path = file_path
@@ -713,6 +1365,11 @@ class UINoteWindow(QWidget):
 
         # Layer Management
         self.canvas_window.label.layer_change.connect(self.change_layers)
+        self.canvas_window.label.save_progress.connect(self.saveProgress)
+        self.canvas_window.label.saved.connect(self.saveFinished)
+        # Window title to put back once a save in progress is done
+        self.title = None
+        self.discarded = False
 
         ########### Saving/Opening ###########
         if self.scheduled:
@@ -720,6 +1377,8 @@ class UINoteWindow(QWidget):
         elif self.file_path is not None:
             self.file_path = self.file_path[:-1]
             self.open_directory(self.file_path)
+        elif recover is not None:
+            self.file_path = self.canvas_window.label.recover(recover) or ""
         else:
             self.file_path = ""
 
@@ -727,6 +1386,7 @@ class UINoteWindow(QWidget):
 
     ########### Closing ###########
     def closeEvent(self, event):
+        self.canvas_window.label.waitForSaves()
         if self.canvas_window.label.hasChanged():
             self.savePopup()
             if self.cancellation:
@@ -735,6 +1395,10 @@ class UINoteWindow(QWidget):
                 event.accept()
             else:
                 event.ignore()
+        if event.isAccepted():
+            self.canvas_window.label.waitForSaves()
+            # A save that failed on the way out leaves the journal behind to be recovered
+            self.canvas_window.label.journal.close(not self.canvas_window.label.hasChanged() or self.discarded)
 
 
     def keyPressEvent(self, event: QtGui.QKeyEvent) -> None:
@@ -748,6 +1412,15 @@ class UINoteWindow(QWidget):
             #for u in Utensils:
             #    u.incrementWidth()
             self.canvas_window.label.cursor_update()
+        elif event.modifiers() & Qt.ControlModifier and event.key() in (Qt.Key_Equal, Qt.Key_Plus):
+            self.canvas_window.zoomCenter(1.25)
+        elif event.modifiers() & Qt.ControlModifier and event.key() == Qt.Key_Minus:
+            self.canvas_window.zoomCenter(0.8)
+        elif event.modifiers() & Qt.ControlModifier and event.key() == Qt.Key_0:
+            self.canvas_window.zoomCenter(1 / self.canvas_window.label.zoom)
+        elif event.key() == Qt.Key_E:
+            self.canvas_window.label.cycleEraserMode()
+            self.eraser_button.setToolTip("Eraser (" + self.canvas_window.label.eraser_mode + ")")
 
     def savePopup(self):
         self.save_prompt = QtWidgets.QDialog(self)
@@ -776,6 +1449,7 @@ class UINoteWindow(QWidget):
 
     def acceptDiscard(self):
         self.non_cancelleation = True
+        self.discarded = True
         self.save_prompt.deleteLater()
 
     def erase(self):
@@ -832,6 +1506,7 @@ class UINoteWindow(QWidget):
         self.eraser_button = ToolButton(assets["eraser"])
         self.button_layout.addWidget(self.eraser_button, 0, 1)
         self.eraser_button.clicked.connect(self.erase)
+        self.eraser_button.setToolTip("Eraser (" + self.canvas_window.label.eraser_mode + ")")
         self.highlighter_button = ToolButton(assets["highlighter"])
         self.button_layout.addWidget(self.highlighter_button, 0, 2)
         self.highlighter_button.clicked.connect(self.highlight)
@@ -880,23 +1555,20 @@ class UINoteWindow(QWidget):
         self.color_indicator.setStyleSheet("background-color: rgba(" + str(r) + "," + str(g) + "," + str(b) + "," + str(a) + "); margin-top: 10px; margin-left: 10px;")
 
     def change_layers(self):
-        if len(self.canvas_window.label.activeLayers) > 1:
+        if self.canvas_window.label.history.can_undo():
             self.undo_button.setEnabled(True)
             self.clear_button.setEnabled(True)
         else:
             self.undo_button.setDisabled(True)
             self.clear_button.setDisabled(True)
+        if self.canvas_window.label.isBlank():
+            self.clear_button.setDisabled(True)
 
-        if len(self.canvas_window.label.inactiveLayers) > 0:
+        if self.canvas_window.label.history.can_redo():
             self.redo_button.setEnabled(True)
         else:
             self.redo_button.setDisabled(True)
 
-        compare_canvas_layer = QtGui.QPixmap(self.canvas_window.label.size())
-        compare_canvas_layer.fill(Qt.white)
-        if self.canvas_window.label.activeLayers[0].toImage() == compare_canvas_layer.toImage() or self.canvas_window.label.activeLayers[-1].toImage() == compare_canvas_layer.toImage():
-            self.clear_button.setDisabled(True)
-
 
     # def pen_button_display(self):
     #     self.pen_button = ToolButton(assets["pen"])
@@ -939,15 +1611,12 @@ class UINoteWindow(QWidget):
             self.save_as()
         else:
             self.canvas_window.label.save(self.file_path)
-            self.directories_update()
-            self.update_open_recent_menu()
-        self.update_open_recent_menu()
 
     def save_as(self):
         file_path, _ = QtWidgets.QFileDialog.getSaveFileName(self,
                                                                     "Save Notes", # Caption
-                                                                    "notes.jpg", # File-name, directory
-                                                                    "JPG (*.jpg);;PNG (*.png)") # File types
+                                                                    "notes" + NOTE_SUFFIX, # File-name, directory
+                                                                    "Lotus Note (*" + NOTE_SUFFIX + ");;JPG (*.jpg);;PNG (*.png)") # File types
 
         # Blank file path
         if file_path == "":
@@ -955,10 +1624,25 @@ class UINoteWindow(QWidget):
         self.file_path = file_path
 
         # Saving canvas
+        self.setWindowTitle(self.file_path)
         self.canvas_window.label.save(self.file_path)
+
+    def saveProgress(self, percent):
+        if self.title is None:
+            self.title = self.windowTitle()
+        self.setWindowTitle("{} - Saving {}%".format(self.title, percent))
+
+    def saveFinished(self, file_path, message):
+        if self.title is not None:
+            self.setWindowTitle(self.title)
+            self.title = None
+        if message:
+            error = QMessageBox()
+            error.setText("Error: Could not save {}. {}".format(file_path, message))
+            error.exec_()
+            return
         self.directories_update()
         self.update_open_recent_menu()
-        self.setWindowTitle(self.file_path)
 
     def directories_update(self):
         try:
@@ -1164,7 +1848,7 @@ class UINoteWindow(QWidget):
         if self.canvas_window.label.hasChanged():
             self.savePopup()
         if not file_path:
-            file_path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Open File", "/home", "JPG (*.jpg);;PNG (*.png)")
+            file_path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Open File", "/home", "Lotus Note (*" + NOTE_SUFFIX + ");;JPG (*.jpg);;PNG (*.png)")
             if file_path == "":
                 return
             self.file_path = file_path
@@ -1218,14 +1902,21 @@ class UINoteWindow(QWidget):
                         f.writelines(p + "\n" for p in paths)
                 self.deleted_file.emit(file_path)
                 self.deleteLater()
+        elif file_path.lower().endswith(NOTE_SUFFIX):
+            self.canvas_window.label.loadNote(file_path)
         else:
             self.canvas_window.label.loadImage(file_path)
 
     def ocr(self):
         if self.canvas_window.label.hasChanged() or self.file_path == "":
             self.savePopup()
+        self.canvas_window.label.waitForSaves()
         if not self.canvas_window.label.hasChanged():
-            ocr_findings = pytesseract.image_to_string(Image.open(self.file_path))
+            # Read from the canvas rather than the saved file, which may be a .lotus note
+            image = self.canvas_window.label.canvasImage().convertToFormat(QtGui.QImage.Format_RGB888)
+            pixels = Image.frombuffer('RGB', (image.width(), image.height()), image.constBits().asstring(image.sizeInBytes()),
+                                      'raw', 'RGB', image.bytesPerLine(), 1)
+            ocr_findings = pytesseract.image_to_string(pixels)
             ocr_prompt = QtWidgets.QDialog(self)
             ocr_prompt.setWindowTitle("Typed Characters found (OCR)")
             options = QtWidgets.QDialogButtonBox.Close
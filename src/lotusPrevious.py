@@ -16,6 +16,17 @@ from PyQt5.QtGui import QPixmap, QIcon
 from PyQt5.QtWidgets import QPushButton, QWidget
 
 from src.constants import DIRECTORY_FILE, SCHEDULE_FILE_PATH, assets
+from src.lotusFormat import NOTE_SUFFIX, read_thumbnail
+
+
+def note_icon(path:str):
+    # Notes carry their own thumbnail, so the rest of the file is never read just to show it
+    if path.lower().endswith(NOTE_SUFFIX):
+        try:
+            return QIcon(QPixmap.fromImage(read_thumbnail(path)))
+        except (OSError, ValueError):
+            return QIcon()
+    return QIcon(QPixmap(path))
 
 
 class UIPreviousWindow(QWidget):
@@ -174,7 +185,7 @@ class UIPreviousWindow(QWidget):
             if not self.set_paths:
                 for i in range(len(self.directories)):
                     self.buttons[self.directories[i]] = QPushButton(self.directories[i])
-                    self.buttons[self.directories[i]].setIcon(QIcon(QPixmap(self.directories[i].strip())))
+                    self.buttons[self.directories[i]].setIcon(note_icon(self.directories[i].strip()))
                     self.buttons[self.directories[i]].setIconSize(QSize(100,100))
                     self.all_button_layout.addWidget(self.buttons[self.directories[i]])
 
@@ -184,7 +195,7 @@ class UIPreviousWindow(QWidget):
                         for x in self.name_classes:
                             if directory_array[-1].strip()[:-11] == x: ## Change for timestamp
                                 self.other_buttons[self.directories[i]] = QPushButton(self.directories[i])
-                                self.other_buttons[self.directories[i]].setIcon(QIcon(QPixmap(self.directories[i].strip())))
+                                self.other_buttons[self.directories[i]].setIcon(note_icon(self.directories[i].strip()))
                                 self.other_buttons[self.directories[i]].setIconSize(QSize(100, 100))
                                 #self.all_button_layout.addWidget(self.other_buttons[self.directories[i]])
                                 self.class_layouts[x].addWidget(self.other_buttons[self.directories[i]])
@@ -0,0 +1,135 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+import os
+import threading
+
+########### PyQT5 imports ###########
+from PyQt5.QtCore import Qt, QObject, QRect, QSize, pyqtSignal
+from PyQt5.QtGui import QImage, QImageWriter, QPainter
+
+from src.lotusFormat import THUMBNAIL_WIDTH, write_note
+from src.lotusNotebook import PageImage
+from src.lotusSurface import HighlightOverlay, resolve_tile
+
+
+class SaveSignals(QObject):
+    # Lives on the GUI thread; progress is in percent, finished is picked up by the canvas through a queued connection
+    progress = pyqtSignal(int)
+    finished = pyqtSignal()
+
+
+def first_page(page_size:QSize, page_height:int):
+    # The part of the page a note's thumbnail shows
+    return QRect(0, 0, page_size.width(), min(page_size.height(), page_height))
+
+
+class PageSnapshot:
+    # The page as it was when a save started, cheap to take on the GUI thread and composited on the worker
+    # rect limits it to the tiles a save will draw, e.g. only the first page for a note's thumbnail
+    def __init__(self, surface, page_size:QSize, page_height:int, base, highlights:list, rect:QRect=None):
+        self.tiles = surface.snapshot(rect)
+        self.tile_size = surface.tile_size
+        self.tile_rect = surface.tile_rect
+        self.keys_for = surface.keys_for
+        self.page_size = QSize(page_size)
+        self.page_height = page_height
+        # Path or bytes of the page image, reopened on the worker so its band cache is never shared across threads
+        self.base = base
+        self.highlights = highlights
+
+    def paint(self, painter:QPainter, rect:QRect, base_image=None, overlay=None):
+        # Same layers as TiledSurface.render(): white, page image, highlights, ink
+        painter.fillRect(rect, Qt.white)
+        if base_image is not None:
+            base_image.paint(painter, rect)
+        if overlay is not None:
+            overlay.paint(painter, rect)
+        for key in self.keys_for(rect):
+            image = resolve_tile(self.tiles.get(key), self.tile_size)
+            if image is not None:
+                tile_rect = self.tile_rect(key)
+                source = rect.intersected(tile_rect)
+                painter.drawImage(source, image, source.translated(-tile_rect.topLeft()))
+
+    def layers(self):
+        base_image = PageImage(self.base, self.page_height) if self.base is not None else None
+        overlay = HighlightOverlay()
+        for record in self.highlights:
+            overlay.add(record)
+        return base_image, overlay
+
+    def thumbnail(self):
+        # The first page, THUMBNAIL_WIDTH wide
+        page = first_page(self.page_size, self.page_height)
+        scale = THUMBNAIL_WIDTH / max(1, page.width())
+        image = QImage(THUMBNAIL_WIDTH, max(1, round(page.height() * scale)), QImage.Format_RGB32)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+        painter.scale(scale, scale)
+        self.paint(painter, page, *self.layers())
+        painter.end()
+        return image
+
+    def image(self, progress=None):
+        # The whole page, one row of tiles at a time so progress(fraction) can be reported along the way
+        image = QImage(self.page_size, QImage.Format_RGB32)
+        base_image, overlay = self.layers()
+        painter = QPainter(image)
+        rows = range(0, self.page_size.height(), self.tile_size)
+        for row, top in enumerate(rows):
+            if base_image is not None:
+                # Keeps the page band being composited decoded across its rows of tiles
+                base_image.keep(range(top // self.page_height, (top + self.tile_size - 1) // self.page_height + 1))
+            self.paint(painter, QRect(0, top, self.page_size.width(), min(self.tile_size, self.page_size.height() - top)), base_image, overlay)
+            if progress is not None:
+                progress((row + 1) / len(rows))
+        painter.end()
+        return image
+
+
+class SaveJob:
+    # Encodes a snapshot on a worker and swaps it in for path in one rename, so a crash mid-save never leaves a torn file
+    def __init__(self, path:str, snapshot:PageSnapshot, note, state, widgets:list, mark:int, signals:SaveSignals):
+        self.path = path
+        self.snapshot = snapshot
+        # Note for a .lotus save, None to export the flattened page as an image
+        self.note = note
+        # History state, widget states and journal position the snapshot was taken at
+        self.state = state
+        self.widgets = widgets
+        self.mark = mark
+        self.signals = signals
+        self.error = None
+        self.ready = threading.Event()
+
+    def run(self):
+        temp = self.path + '.tmp'
+        try:
+            if self.note is not None:
+                self.note.thumbnail = self.snapshot.thumbnail()
+                self.signals.progress.emit(20)
+                write_note(temp, self.note)
+            else:
+                image = self.snapshot.image(lambda fraction: self.signals.progress.emit(int(fraction * 80)))
+                writer = QImageWriter(temp, (os.path.splitext(self.path)[1][1:].lower() or 'png').encode())
+                if not writer.write(image):
+                    raise OSError(writer.errorString())
+            self.signals.progress.emit(90)
+            with open(temp, 'rb+') as file:
+                os.fsync(file.fileno())
+            os.replace(temp, self.path)
+            self.signals.progress.emit(100)
+        except Exception as error:
+            self.error = str(error) or type(error).__name__
+            if os.path.exists(temp):
+                os.remove(temp)
+        finally:
+            self.snapshot = None
+            self.ready.set()
+            self.signals.finished.emit()
@@ -0,0 +1,82 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+import numpy as np
+
+from src.lotusEraser import stroke_points
+from src.lotusStrokes import Stroke
+
+
+def segment_distance(points, start, end):
+    # Distance from each row of points to the segment start-end, in any number of dimensions
+    direction = end - start
+    length = direction @ direction
+    t = np.clip((points - start) @ direction / length, 0, 1) if length > 0 else np.zeros(len(points))
+    return np.linalg.norm(points - (start + t[:, None] * direction), axis=1)
+
+
+def simplify(points, tolerance:float, keep=None):
+    # Ramer-Douglas-Peucker: which points to keep so that none of the dropped ones is further than tolerance from the result
+    # Points already set in keep stay, and each span between them is simplified on its own so the tolerance still holds
+    keep = np.zeros(len(points), dtype=bool) if keep is None else keep.copy()
+    keep[0] = keep[-1] = True
+    fixed = np.flatnonzero(keep).tolist()
+    stack = list(zip(fixed, fixed[1:]))
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distance = segment_distance(points[first + 1:last], points[first], points[last])
+        index = int(np.argmax(distance))
+        if distance[index] > tolerance:
+            index += first + 1
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return keep
+
+
+def thin_samples(last, samples, min_distance:float):
+    # Capture-time filter: samples closer than min_distance to the last kept one add nothing visible but cost storage and render time
+    # Samples are tuples that start with their QPoint; returns the kept ones and the newest dropped one, if it came after them
+    kept = []
+    held = None
+    for sample in samples:
+        delta = sample[0] - last
+        if delta.x() * delta.x() + delta.y() * delta.y() < min_distance * min_distance:
+            held = sample
+            continue
+        kept.append(sample)
+        last = sample[0]
+        held = None
+    return kept, held
+
+
+def width_runs(widths, tolerance:float):
+    # Pressure segments are drawn at the width of their end point, so segments can only be merged while their widths stay within tolerance
+    keep = np.zeros(len(widths), dtype=bool)
+    keep[0] = keep[-1] = True
+    low = high = widths[1]
+    for index in range(2, len(widths)):
+        low = min(low, widths[index])
+        high = max(high, widths[index])
+        if high - low > tolerance:
+            keep[index - 1] = True
+            low = high = widths[index]
+    return keep
+
+
+def simplify_stroke(stroke:Stroke, tolerance:float):
+    # Stroke with only the points RDP keeps, plus whatever pressure strokes need to keep their widths
+    if stroke.point_count() < 3 or tolerance <= 0:
+        return stroke
+    widths = width_runs(np.frombuffer(stroke.widths, dtype=np.float32), tolerance) if stroke.widths is not None else None
+    keep = simplify(stroke_points(stroke), tolerance, widths)
+    if keep.all():
+        return stroke
+    return stroke.subset(np.flatnonzero(keep).tolist())
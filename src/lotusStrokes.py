@@ -0,0 +1,179 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+from array import array
+
+########### PyQT5 imports ###########
+from PyQt5 import QtGui
+from PyQt5.QtCore import Qt, QPoint, QPointF, QRect, QRectF
+from PyQt5.QtGui import QColor, QPainter, QPainterPath
+
+
+class Stroke:
+    # Compact vector record for one pen/eraser stroke; points are stored flat as x0, y0, x1, y1, ...
+    # Stylus strokes also carry one width per point, already mapped from pressure by the utensil
+    def __init__(self, utensil:str, color:QColor, width:int, pressure=False):
+        self.utensil = utensil
+        self.rgba = QColor(color).rgba()
+        self.width = width
+        self.points = array('i')
+        self.widths = array('f') if pressure else None
+        self._bounds = QRect()
+        self._pen = self.pen()
+        # Place on the page, a tuple so pieces split off a record sort right where it was; set when it is added
+        self.order = None
+        # Smooth strokes are drawn as a Catmull-Rom curve through their points instead of a polyline
+        self.smooth = False
+
+    def add_point(self, point:QPoint, width:float=None):
+        self.points.append(point.x())
+        self.points.append(point.y())
+        if self.widths is not None:
+            self.widths.append(width if width is not None else self.width)
+        self._bounds = self._bounds.united(QRect(point.x(), point.y(), 1, 1))
+
+    def set_points(self, points:array, widths:array, bounds:QRect):
+        # Bulk load of points already known to lie within bounds, e.g. when a note is read from disk
+        self.points = points
+        self.widths = widths
+        self._bounds = QRect(bounds)
+
+    def subset(self, indices):
+        return self.cut([(QPoint(self.points[2 * index], self.points[2 * index + 1]), self.widths[index] if self.widths is not None else None)
+                         for index in indices])
+
+    def cut(self, samples:list):
+        # New stroke with the same style through (point, width) samples
+        piece = Stroke(self.utensil, QColor.fromRgba(self.rgba), self.width, self.widths is not None)
+        for point, width in samples:
+            piece.add_point(point, width)
+        if self.smooth:
+            piece.smoothen()
+        return piece
+
+    def smoothen(self):
+        # The curve stays inside the hull of its control points, so those are added to the bounds
+        self.smooth = True
+        for index in range(1, self.point_count()):
+            first, second = self.curve(index)
+            self._bounds = self._bounds.united(QRectF(first, second).normalized().toAlignedRect())
+
+    def curve(self, index:int):
+        # Bezier control points of the Catmull-Rom segment from point index - 1 to point index
+        count = self.point_count()
+        before = self.point_at(max(index - 2, 0))
+        start = self.point_at(index - 1)
+        end = self.point_at(index)
+        after = self.point_at(min(index + 1, count - 1))
+        return start + (end - before) / 6, end - (after - start) / 6
+
+    def point_at(self, index:int):
+        return QPointF(self.points[2 * index], self.points[2 * index + 1])
+
+    def last_point(self):
+        return QPoint(self.points[-2], self.points[-1])
+
+    def point_count(self):
+        return len(self.points) // 2
+
+    def bounds(self):
+        margin = self.width // 2 + 1
+        return self._bounds.adjusted(-margin, -margin, margin, margin)
+
+    def segment_bounds(self, index:int):
+        margin = self.width // 2 + 2
+        start = QPoint(self.points[2 * index - 2], self.points[2 * index - 1])
+        end = QPoint(self.points[2 * index], self.points[2 * index + 1])
+        return QRect(start, end).normalized().adjusted(-margin, -margin, margin, margin)
+
+    def size(self):
+        return len(self.points) * self.points.itemsize + (len(self.widths) * self.widths.itemsize if self.widths is not None else 0)
+
+    def pen(self, width:float=None):
+        pen = QtGui.QPen(QColor.fromRgba(self.rgba), 1, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+        pen.setWidthF(width if width is not None else self.width)
+        return pen
+
+    def paint(self, painter:QPainter):
+        if self.smooth and self.point_count() > 2:
+            self.paint_curve(painter)
+        elif self.widths is None and len(self.points) > 2:
+            painter.setPen(self._pen)
+            painter.drawPolyline(QtGui.QPolygon(list(self.points)))
+        else:
+            self.paint_range(painter, 0)
+
+    def paint_range(self, painter:QPainter, first:int):
+        # Point first on its own if it starts the stroke, then every segment ending after it
+        if first == 0:
+            painter.setPen(self.pen(self.widths[0]) if self.widths is not None else self._pen)
+            painter.drawPoint(self.points[0], self.points[1])
+        # Pressure strokes change the width per segment on their own copy, since tiles may be painted from several threads
+        pen = QtGui.QPen(self._pen) if self.widths is not None else self._pen
+        for index in range(max(first, 1), self.point_count()):
+            self.paint_segment(painter, index, pen)
+
+    def paint_curve(self, painter:QPainter):
+        painter.setBrush(Qt.NoBrush)
+        if self.widths is None:
+            path = QPainterPath(self.point_at(0))
+            for index in range(1, self.point_count()):
+                path.cubicTo(*self.curve(index), self.point_at(index))
+            painter.setPen(self._pen)
+            painter.drawPath(path)
+            return
+        pen = QtGui.QPen(self._pen)
+        for index in range(1, self.point_count()):
+            path = QPainterPath(self.point_at(index - 1))
+            path.cubicTo(*self.curve(index), self.point_at(index))
+            pen.setWidthF(self.widths[index])
+            painter.setPen(pen)
+            painter.drawPath(path)
+
+    def paint_segment(self, painter:QPainter, index:int, pen:QtGui.QPen):
+        # Segment from point index - 1 to point index; constant-width strokes reuse one pen for every segment
+        if self.widths is not None:
+            pen.setWidthF(self.widths[index])
+        painter.setPen(pen)
+        painter.drawLine(self.points[2 * index - 2], self.points[2 * index - 1], self.points[2 * index], self.points[2 * index + 1])
+
+
+class Highlight:
+    def __init__(self, rect:QRect, color:QColor):
+        self.utensil = "HIGHLIGHTER"
+        self.rect = QRect(rect).normalized()
+        self.rgba = QColor(color).rgba()
+        self.order = None
+
+    def bounds(self):
+        return QRect(self.rect)
+
+    def size(self):
+        return 32
+
+    def paint(self, painter:QPainter):
+        painter.fillRect(self.rect, QColor.fromRgba(self.rgba))
+
+
+class Stamp:
+    # Raster snapshot of a placed floating widget, only as large as the widget itself
+    def __init__(self, pos:QPoint, image:QtGui.QImage):
+        self.utensil = None
+        self.pos = QPoint(pos)
+        self.image = image
+        self.order = None
+
+    def bounds(self):
+        return QRect(self.pos, self.image.size())
+
+    def size(self):
+        return self.image.sizeInBytes()
+
+    def paint(self, painter:QPainter):
+        painter.drawImage(self.pos, self.image)
+
@@ -0,0 +1,467 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+import math
+import tempfile
+import threading
+import zlib
+from itertools import count
+
+########### PyQT5 imports ###########
+from PyQt5.QtCore import Qt, QObject, QRect, QRectF, QSize, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter
+
+from src.lotusIndex import QuadTree, in_order
+
+TILE_SIZE = 256
+# Deepest mip level: 256 px tiles down to 16 px
+MAX_MIP_LEVEL = 4
+
+
+def mip_level(scale:float):
+    # Level whose pixels are still at least as fine as the screen's at this scale
+    if scale >= 1:
+        return 0
+    return min(MAX_MIP_LEVEL, int(math.floor(math.log2(1 / scale))))
+
+
+def blank_tile(tile_size:int):
+    image = QImage(tile_size, tile_size, QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.transparent)
+    return image
+
+
+def decode_tile(data:bytes, tile_size:int):
+    return QImage(zlib.decompress(data), tile_size, tile_size, QImage.Format_ARGB32_Premultiplied).copy()
+
+
+class TileSignals(QObject):
+    # Lives on the GUI thread, so a job finishing on a worker is picked up there through a queued connection
+    finished = pyqtSignal()
+
+
+class TileBatch:
+    # One submit() call; done(rect) runs once every tile it touched has landed
+    def __init__(self, rect:QRect, done=None):
+        self.rect = QRect(rect)
+        self.done = done
+        self.remaining = 0
+
+
+class TileJob:
+    # Repaints part of one tile on a private copy in a worker thread; tiles are QImages, which unlike QPixmaps can be drawn off the GUI thread
+    def __init__(self, key, tile_rect:QRect, rect:QRect, base, restore:bool, source, paint_functions:list, previous, batch:TileBatch, signals:TileSignals):
+        self.key = key
+        self.tile_rect = tile_rect
+        self.rect = rect
+        self.base = base
+        self.restore = restore
+        # QImage, compressed spill bytes, an earlier TileJob whose result is the source, or None for transparent
+        self.source = source
+        self.paint_functions = paint_functions
+        # Earlier job on the same tile that hasn't landed yet; this one draws on top of its result
+        self.previous = previous
+        self.batch = batch
+        self.signals = signals
+        self.applied = False
+        self.result = None
+        self.ready = threading.Event()
+
+    def run(self):
+        try:
+            if self.previous is not None:
+                # The pool starts jobs in the order they were queued, so the previous one is already running or done
+                self.previous.ready.wait()
+                base = self.previous.result
+            else:
+                base = self.base
+            tile_size = self.tile_rect.width()
+            image = blank_tile(tile_size) if base is None else base.copy()
+            painter = QPainter(image)
+            if self.restore:
+                local = self.rect.translated(-self.tile_rect.topLeft())
+                source = resolve_tile(self.source, tile_size)
+                painter.setCompositionMode(QPainter.CompositionMode_Source)
+                if source is None:
+                    painter.fillRect(local, Qt.transparent)
+                else:
+                    painter.drawImage(local, source, local)
+                painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+            painter.setRenderHint(QPainter.Antialiasing, True)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+            painter.translate(-self.tile_rect.x(), -self.tile_rect.y())
+            painter.setClipRect(self.rect)
+            for paint_function in self.paint_functions:
+                paint_function(painter)
+            painter.end()
+            self.result = image
+        finally:
+            self.ready.set()
+            self.signals.finished.emit()
+
+
+class PendingTile:
+    # Tile that so far only exists as the records on it; drawn once its page is needed, or straight into a snapshot
+    def __init__(self, tile_rect:QRect, paint_functions:list):
+        self.tile_rect = tile_rect
+        self.paint_functions = paint_functions
+
+    def render(self):
+        image = blank_tile(self.tile_rect.width())
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+        painter.translate(-self.tile_rect.x(), -self.tile_rect.y())
+        painter.setClipRect(self.tile_rect)
+        for paint_function in self.paint_functions:
+            paint_function(painter)
+        painter.end()
+        return image
+
+
+class SpilledTile:
+    # Tile that is only in the spill file; its pixels are read by whoever resolves it, so a snapshot never reads the disk
+    def __init__(self, surface, reference):
+        self.surface = surface
+        self.reference = reference
+
+    def data(self):
+        return self.surface.read_data(self.reference)
+
+
+def resolve_tile(source, tile_size:int):
+    # Pixels of a tile that may still be compressed, spilled, being painted or not drawn yet; only called off the GUI thread
+    if isinstance(source, TileJob):
+        source.ready.wait()
+        return source.result
+    if isinstance(source, PendingTile):
+        return source.render()
+    if isinstance(source, SpilledTile):
+        return decode_tile(source.data(), tile_size)
+    if isinstance(source, bytes):
+        return decode_tile(source, tile_size)
+    return source
+
+
+class MipJob:
+    # Builds every mip level of one tile in a worker thread
+    def __init__(self, key, image, data, tile_size:int, signals:TileSignals):
+        self.key = key
+        self.image = image
+        self.data = data
+        self.tile_size = tile_size
+        self.signals = signals
+        self.result = None
+        self.ready = threading.Event()
+
+    def run(self):
+        try:
+            image = self.image if self.image is not None else decode_tile(self.data, self.tile_size)
+            levels = []
+            for level in range(1, MAX_MIP_LEVEL + 1):
+                image = image.scaled(image.width() // 2, image.height() // 2, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+                levels.append(image)
+            self.result = levels
+        finally:
+            self.ready.set()
+            self.signals.finished.emit()
+
+
+class TiledSurface:
+    # Sparse backing store: fixed-size transparent tiles that only exist once something is drawn on them
+    def __init__(self, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self.tiles = {}
+        # Tiles that were dropped from memory: key -> (offset, length) of their compressed pixels in spill_file
+        self.spilled = {}
+        # key -> PendingTile for tiles of a loaded note that haven't been drawn yet
+        self.pending = {}
+        self.spill_file = None
+        # The spill file is only ever appended to, but its position is shared with save workers reading snapshots
+        self.spill_lock = threading.Lock()
+        # (key, level) -> tile downscaled by 2 ** level, built on demand and dropped when the tile is drawn on
+        self.mips = {}
+        # key -> newest TileJob / MipJob for the tile that hasn't landed yet
+        self.jobs = {}
+        self.mip_jobs = {}
+        # A pool of its own: Qt converts and scales larger images on the global pool while the GUI thread waits,
+        # which never finishes if every global thread is a tile job waiting for the GIL that GUI thread holds
+        self.pool = QThreadPool()
+        self.signals = TileSignals()
+        self.signals.finished.connect(self.collect)
+        # landed(rect) is called on the GUI thread whenever finished pixels replace what was on screen
+        self.landed = None
+
+    def tile_rect(self, key):
+        return QRect(key[0] * self.tile_size, key[1] * self.tile_size, self.tile_size, self.tile_size)
+
+    def keys_for(self, rect:QRect):
+        if rect.isEmpty():
+            return []
+        first_col = max(rect.left(), 0) // self.tile_size
+        first_row = max(rect.top(), 0) // self.tile_size
+        last_col = max(rect.right(), 0) // self.tile_size
+        last_row = max(rect.bottom(), 0) // self.tile_size
+        return [(col, row) for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)]
+
+    def tile(self, key, create=False):
+        image = self.tiles.get(key)
+        if image is None and key in self.spilled:
+            image = self.load(key)
+        if image is None and create:
+            image = blank_tile(self.tile_size)
+            self.tiles[key] = image
+        return image
+
+    def paint(self, rect:QRect, paint_function, painter:QPainter=None):
+        # Runs paint_function once per tile touched by rect, in page coordinates, right away on this thread
+        painter = painter if painter is not None else QPainter()
+        self.realize(self.keys_for(rect))
+        self.settle(self.keys_for(rect))
+        for key in self.keys_for(rect):
+            self.invalidate(key)
+            tile_rect = self.tile_rect(key)
+            painter.begin(self.tile(key, create=True))
+            painter.setRenderHint(QPainter.Antialiasing, True)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+            painter.translate(-tile_rect.x(), -tile_rect.y())
+            painter.setClipRect(rect)
+            paint_function(painter)
+            painter.end()
+
+    def submit(self, rect:QRect, paint_functions:list, sources:dict=None, done=None):
+        # Repaints rect on the worker pool: restored from sources first when given (as in restore()), then paint_functions in order
+        # The tiles keep their old pixels until the new ones land, so the screen never shows a half-finished repaint
+        self.realize(self.keys_for(rect))
+        batch = TileBatch(rect, done)
+        jobs = []
+        for key in self.keys_for(rect):
+            source = None
+            if sources is not None:
+                source = sources.get(key)
+                if source is None and len(paint_functions) == 0 and key not in self.tiles and key not in self.spilled and key not in self.jobs:
+                    continue
+                if isinstance(source, tuple):
+                    source = self.read_data(source)
+            previous = self.jobs.get(key)
+            base = self.tile(key) if previous is None else None
+            tile_rect = self.tile_rect(key)
+            job = TileJob(key, tile_rect, rect.intersected(tile_rect), base, sources is not None, source, paint_functions, previous, batch, self.signals)
+            self.jobs[key] = job
+            jobs.append(job)
+        batch.remaining = len(jobs)
+        if len(jobs) == 0:
+            self.land(batch)
+        for job in jobs:
+            self.pool.start(job.run)
+
+    def realize(self, keys):
+        # Queues the drawing of pending tiles among keys, ahead of anything else that is painted on them
+        for key in keys:
+            pending = self.pending.pop(key, None)
+            if pending is not None:
+                self.submit(pending.tile_rect, pending.paint_functions)
+
+    def collect(self):
+        for job in list(self.jobs.values()):
+            if job.ready.is_set():
+                self.apply(job)
+        for job in list(self.mip_jobs.values()):
+            if job.ready.is_set() and self.mip_jobs.get(job.key) is job:
+                del self.mip_jobs[job.key]
+                for level, image in enumerate(job.result or [], 1):
+                    self.mips[(job.key, level)] = image
+                if self.landed is not None:
+                    self.landed(self.tile_rect(job.key))
+
+    def apply(self, job:TileJob):
+        del self.jobs[job.key]
+        if job.result is not None:
+            self.tiles[job.key] = job.result
+        self.invalidate(job.key)
+        # Landing the newest job on a tile also lands every job it was chained after
+        finished = []
+        while job is not None and not job.applied:
+            job.applied = True
+            job.batch.remaining -= 1
+            if job.batch.remaining == 0:
+                finished.append(job.batch)
+            job.previous, job = None, job.previous
+        for batch in reversed(finished):
+            self.land(batch)
+
+    def land(self, batch:TileBatch):
+        if batch.done is not None:
+            batch.done(batch.rect)
+        if self.landed is not None:
+            self.landed(batch.rect)
+
+    def settle(self, keys=None):
+        # Waits for the pending jobs on keys (all of them by default) and lands them, before the tiles are used directly
+        keys = list(self.jobs) if keys is None else keys
+        for key in keys:
+            job = self.jobs.get(key)
+            if job is not None:
+                job.ready.wait()
+                self.apply(job)
+
+    def clear(self):
+        self.settle()
+        self.tiles = {}
+        self.spilled = {}
+        self.pending = {}
+        self.mips = {}
+        self.mip_jobs = {}
+
+    def invalidate(self, key):
+        self.mip_jobs.pop(key, None)
+        for level in range(1, MAX_MIP_LEVEL + 1):
+            self.mips.pop((key, level), None)
+
+    def request_mips(self, key):
+        # Queues the mips of a tile unless they are already coming; a tile still being repainted waits until it lands
+        if key in self.mip_jobs or key in self.jobs:
+            return
+        image = self.tiles.get(key)
+        data = None
+        if image is None:
+            if key not in self.spilled:
+                return
+            data = self.read_data(self.spilled[key])
+        job = MipJob(key, QImage(image) if image is not None else None, data, self.tile_size, self.signals)
+        self.mip_jobs[key] = job
+        self.pool.start(job.run)
+
+    def image_for(self, key):
+        # Tile pixels for reading only; a spilled tile is decoded without being made resident again
+        image = self.tiles.get(key)
+        if image is None and key in self.spilled:
+            image = self.read(self.spilled[key])
+        return image
+
+    def spill(self, keys):
+        # Writes tiles to the spill file and drops them from memory; returns {cacheKey: spill reference}
+        self.settle(keys)
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile()
+        released = {}
+        for key in keys:
+            image = self.tiles.pop(key, None)
+            if image is None:
+                continue
+            data = zlib.compress(image.constBits().asstring(image.sizeInBytes()), 1)
+            with self.spill_lock:
+                self.spill_file.seek(0, 2)
+                reference = (self.spill_file.tell(), len(data))
+                self.spill_file.write(data)
+            self.spilled[key] = reference
+            released[image.cacheKey()] = reference
+        return released
+
+    def load(self, key):
+        image = self.read(self.spilled.pop(key))
+        self.tiles[key] = image
+        return image
+
+    def read(self, reference):
+        return decode_tile(self.read_data(reference), self.tile_size)
+
+    def read_data(self, reference):
+        # Compressed pixels only, so the decompression can happen on a worker
+        with self.spill_lock:
+            self.spill_file.seek(reference[0])
+            return self.spill_file.read(reference[1])
+
+    def snapshot(self, rect:QRect=None):
+        # Every tile as it is now, or only those over rect, without waiting on the pool or touching the disk:
+        # shallow copies, pending jobs and references to spilled pixels, all of which can be resolved on a worker
+        keys = None if rect is None else set(self.keys_for(rect))
+        def covered(tiles:dict):
+            return tiles.items() if keys is None else [(key, tile) for key, tile in tiles.items() if key in keys]
+        tiles = {key: SpilledTile(self, reference) for key, reference in covered(self.spilled)}
+        tiles.update({key: QImage(image) for key, image in covered(self.tiles)})
+        tiles.update(covered(self.jobs))
+        tiles.update(covered(self.pending))
+        return tiles
+
+    def render(self, painter:QPainter, rect:QRect, background=Qt.white, underlay=None, scale=1.0):
+        # underlay(painter, rect, scale) is drawn between the background and the ink
+        # Below 100% the painter is expected to be scaled already, and each tile is drawn from its nearest mip;
+        # until that mip comes back from the pool a resident tile is drawn scaled down instead
+        painter.fillRect(rect, background)
+        if underlay is not None:
+            underlay(painter, rect, scale)
+        level = mip_level(scale)
+        for key in self.keys_for(rect):
+            if key in self.pending:
+                self.realize([key])
+                continue
+            image = self.image_for(key) if level == 0 else self.mips.get((key, level))
+            if image is None and level > 0:
+                self.request_mips(key)
+                image = self.tiles.get(key)
+                if image is None:
+                    continue
+                factor = 1
+            else:
+                factor = 1 / (1 << level)
+            if image is not None:
+                tile_rect = self.tile_rect(key)
+                source = rect.intersected(tile_rect)
+                local = source.translated(-tile_rect.x(), -tile_rect.y())
+                if factor == 1:
+                    painter.drawImage(source, image, local)
+                else:
+                    painter.drawImage(QRectF(source), image, QRectF(local.x() * factor, local.y() * factor, local.width() * factor, local.height() * factor))
+
+    def toImage(self, size:QSize, background=Qt.white, underlay=None):
+        self.realize(list(self.pending))
+        self.settle()
+        image = QImage(size, QImage.Format_RGB32)
+        painter = QPainter(image)
+        self.render(painter, image.rect(), background, underlay)
+        painter.end()
+        return image
+
+
+class HighlightOverlay:
+    # Highlights are plain rectangles, so they stay records and are filled straight into whatever is being composited
+    def __init__(self):
+        self.records = []
+        self.index = QuadTree()
+        self.sequence = count()
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, record):
+        if record.order is None:
+            record.order = (next(self.sequence),)
+        self.records.append(record)
+        self.index.insert(record, record.bounds())
+
+    def remove(self, record):
+        self.records.remove(record)
+        self.index.remove(record)
+
+    def replace(self, index, old, new):
+        self.records[index:index + len(old)] = new
+        for record in old:
+            self.index.remove(record)
+        for record in new:
+            self.index.insert(record, record.bounds())
+
+    def records_in(self, rect:QRect):
+        return in_order(self.index.query(rect))
+
+    def size(self):
+        return sum(record.size() for record in self.records)
+
+    def paint(self, painter:QPainter, rect:QRect):
+        for record in self.records_in(rect):
+            painter.fillRect(record.rect.intersected(rect), QColor.fromRgba(record.rgba))
@@ -0,0 +1,68 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+import numpy as np
+
+########### PyQT5 imports ###########
+from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtGui import QColor
+
+from src.lotusEraser import erased_segments, split_stroke, stroke_points
+from src.lotusStrokes import Stroke
+
+# Eraser radius and pen width, so a point erases within 20 / 2 + 4 / 2 = 12 px of the eraser path
+RADIUS = 20
+WIDTH = 4
+
+
+def make_stroke(points:list, widths:list=None):
+    stroke = Stroke('PEN', QColor(Qt.black), WIDTH, widths is not None)
+    for index, (x, y) in enumerate(points):
+        stroke.add_point(QPoint(x, y), widths[index] if widths is not None else None)
+    return stroke
+
+
+def erase(stroke:Stroke, start:tuple, end:tuple=None):
+    start = QPoint(*start)
+    end = QPoint(*end) if end is not None else start
+    pieces = split_stroke(stroke, erased_segments(stroke, start, end, RADIUS), start, end, RADIUS)
+    return [stroke_points(piece).astype(int).tolist() for piece in pieces]
+
+
+def test_dab_cuts_long_segment_at_the_eraser():
+    # A line RDP left as one segment keeps everything outside the dab
+    line = make_stroke([(0, 100), (1000, 100)])
+    assert erase(line, (500, 100)) == [[[0, 100], [488, 100]], [[512, 100], [1000, 100]]]
+    # Off center, the cut is where the segment crosses the circle
+    assert erase(line, (500, 108)) == [[[0, 100], [491, 100]], [[509, 100], [1000, 100]]]
+
+
+def test_drag_cuts_along_the_eraser_path():
+    line = make_stroke([(0, 100), (1000, 100)])
+    assert erase(line, (300, 100), (600, 100)) == [[[0, 100], [288, 100]], [[612, 100], [1000, 100]]]
+    # Crossing the line cuts it on both sides of where the eraser went over it
+    pieces = erase(line, (500, 0), (500, 200))
+    assert pieces == [[[0, 100], [488, 100]], [[512, 100], [1000, 100]]]
+
+
+def test_ends_and_corners():
+    line = make_stroke([(0, 100), (1000, 100)])
+    assert erase(line, (0, 100)) == [[[12, 100], [1000, 100]]]
+    assert erase(line, (1000, 100)) == [[[0, 100], [988, 100]]]
+    square = make_stroke([(0, 0), (100, 0), (100, 100), (0, 100)])
+    assert erase(square, (100, 0)) == [[[0, 0], [88, 0]], [[100, 12], [100, 100], [0, 100]]]
+    assert erase(square, (100, 50)) == [[[0, 0], [100, 0], [100, 38]], [[100, 62], [100, 100], [0, 100]]]
+
+
+def test_cut_ends_keep_their_segment_width():
+    stroke = make_stroke([(0, 0), (100, 0), (200, 0)], [2, 4, 6])
+    start = QPoint(150, 0)
+    pieces = split_stroke(stroke, erased_segments(stroke, start, start, RADIUS), start, start, RADIUS)
+    # The segment is drawn at width 6, so it reaches 20 / 2 + 6 / 2 = 13 px
+    assert [stroke_points(piece).astype(int).tolist() for piece in pieces] == [[[0, 0], [100, 0], [137, 0]], [[163, 0], [200, 0]]]
+    assert [np.asarray(piece.widths).tolist() for piece in pieces] == [[2, 4, 6], [6, 6]]
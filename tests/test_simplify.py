@@ -0,0 +1,168 @@
+# CIS 4930
+########### Contributors ###########
+# Nipuna Weerapperuma
+# Hannah Williams
+# David Jaworski
+# Carlos Morales-Diaz
+# Spencer Bass
+
+import json
+import math
+import os
+import random
+
+import numpy as np
+import pytest
+
+########### PyQT5 imports ###########
+from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtGui import QColor
+
+from src.lotusEraser import stroke_points
+from src.lotusSimplify import simplify_stroke, thin_samples
+from src.lotusStrokes import Stroke
+
+# Canvas defaults for stroke_min_distance and stroke_tolerance
+MIN_DISTANCE = 2
+TOLERANCE = 0.75
+
+# Raw pointer samples as x, y, milliseconds and, for the tablet, pressure; the pen width maps pressure like Utensil.pressure_width
+with open(os.path.join(os.path.dirname(__file__), 'fixtures', 'traces.json')) as file:
+    RECORDED = json.load(file)
+PEN_WIDTH = 6
+
+
+def handwriting(count:int, seed:int):
+    # Loops sampled as densely as a fast mouse poll or a tablet, rounded to whole pixels like mouse events
+    generator = random.Random(seed)
+    points = []
+    for index in range(count):
+        t = index / count * 6 * math.pi
+        x = 200 + index * 0.9 + 25 * math.cos(t * 1.3)
+        y = 300 + 60 * math.sin(t) + 8 * math.sin(t * 3.1)
+        points.append((round(x + generator.uniform(-0.4, 0.4)), round(y + generator.uniform(-0.4, 0.4))))
+    return points
+
+
+def line(count:int):
+    return [(100 + index, 100 + index // 2) for index in range(count)]
+
+
+def circle(count:int):
+    return [(round(400 + 150 * math.cos(index / count * 2 * math.pi)), round(400 + 150 * math.sin(index / count * 2 * math.pi)))
+            for index in range(count)]
+
+
+def make_stroke(points:list, widths:list=None):
+    stroke = Stroke('PEN', QColor(Qt.black), 3, widths is not None)
+    for index, (x, y) in enumerate(points):
+        stroke.add_point(QPoint(x, y), widths[index] if widths is not None else None)
+    return stroke
+
+
+def deviation(original:Stroke, simplified:Stroke):
+    # Largest distance from a recorded point to the simplified polyline
+    points = stroke_points(original)
+    kept = stroke_points(simplified)
+    starts, ends = kept[:-1], kept[1:]
+    direction = ends - starts
+    length = np.einsum('ij,ij->i', direction, direction)
+    offset = points[:, None, :] - starts[None, :, :]
+    t = np.clip(np.einsum('pij,ij->pi', offset, direction) / np.where(length > 0, length, 1), 0, 1)
+    nearest = starts[None, :, :] + t[..., None] * direction[None, :, :]
+    return np.linalg.norm(points[:, None, :] - nearest, axis=2).min(axis=1).max()
+
+
+def captured(name:str):
+    # Samples as the canvas keeps them: thinned to MIN_DISTANCE, with the last dropped one added back at pen-up
+    trace = RECORDED[name]
+    pressure = 'pressure' in trace['columns']
+    samples = [(QPoint(row[0], row[1]), PEN_WIDTH * row[3] if pressure else None) for row in trace['samples']]
+    kept, held = thin_samples(samples[0][0], samples[1:], MIN_DISTANCE)
+    kept = [samples[0]] + kept + ([held] if held is not None else [])
+    return samples, kept
+
+
+@pytest.mark.parametrize('name', sorted(RECORDED))
+def test_recorded_reduction(name):
+    samples, kept = captured(name)
+    raw = make_stroke([(pos.x(), pos.y()) for pos, _ in samples])
+    stroke = make_stroke([(pos.x(), pos.y()) for pos, _ in kept], [width for _, width in kept] if kept[0][1] is not None else None)
+    simplified = simplify_stroke(stroke, TOLERANCE)
+    ratio = len(samples) / simplified.point_count()
+    print('%s: %d samples -> %d captured -> %d stored (%.1fx)' % (name, len(samples), stroke.point_count(), simplified.point_count(), ratio))
+    assert deviation(stroke, simplified) <= TOLERANCE
+    # A thinned sample lies within MIN_DISTANCE of a kept one
+    assert deviation(raw, simplified) <= MIN_DISTANCE + TOLERANCE
+    assert simplified.last_point() == samples[-1][0]
+    # At 125 Hz a mouse already reports points a few pixels apart, so there is less to drop without leaving the tolerance
+    assert ratio >= (2.5 if RECORDED[name]['rate'] < 200 else 5)
+
+
+def test_recorded_reduction_overall():
+    samples = stored = 0
+    for name in RECORDED:
+        raw, kept = captured(name)
+        stroke = make_stroke([(pos.x(), pos.y()) for pos, _ in kept], [width for _, width in kept] if kept[0][1] is not None else None)
+        samples += len(raw)
+        stored += simplify_stroke(stroke, TOLERANCE).point_count()
+    assert samples / stored >= 5
+
+
+@pytest.mark.parametrize('name', sorted(RECORDED))
+def test_capture_filter(name):
+    samples, kept = captured(name)
+    for previous, sample in zip(kept[:-2], kept[1:-1]):
+        delta = sample[0] - previous[0]
+        assert delta.x() * delta.x() + delta.y() * delta.y() >= MIN_DISTANCE * MIN_DISTANCE
+    assert kept[-1] is samples[-1]
+    # The canvas thins each frame's batch on its own, which must not change what is kept
+    batched = []
+    last = samples[0][0]
+    held = None
+    for start in range(1, len(samples), 7):
+        more, dropped = thin_samples(last, samples[start:start + 7], MIN_DISTANCE)
+        batched += more
+        if len(more) > 0:
+            last = more[-1][0]
+        if len(more) > 0 or dropped is not None:
+            held = dropped
+    assert [samples[0]] + batched + ([held] if held is not None else []) == kept
+
+
+def test_capture_filter_holds_last_sample():
+    samples = [(QPoint(10, 10), None), (QPoint(11, 10), None), (QPoint(13, 10), None), (QPoint(14, 11), None)]
+    kept, held = thin_samples(QPoint(10, 10), samples[1:], MIN_DISTANCE)
+    assert kept == [samples[2]]
+    assert held == samples[3]
+    kept, held = thin_samples(QPoint(10, 10), samples[1:3], MIN_DISTANCE)
+    assert held is None
+
+
+def test_pressure_stroke_within_tolerance():
+    points = handwriting(800, 3)
+    stroke = make_stroke(points, [2 + 4 * abs(math.sin(index / 60)) for index in range(len(points))])
+    simplified = simplify_stroke(stroke, TOLERANCE)
+    print('pressure: %d -> %d points' % (stroke.point_count(), simplified.point_count()))
+    assert deviation(stroke, simplified) <= TOLERANCE
+    assert simplified.point_count() < stroke.point_count()
+
+
+def test_pressure_widths_within_tolerance():
+    # A straight line, so only the widths decide what is kept; x identifies each point
+    points = line(500)
+    widths = [2 + 4 * abs(math.sin(index / 60)) for index in range(len(points))]
+    simplified = simplify_stroke(make_stroke(points, widths), TOLERANCE)
+    kept = [x - points[0][0] for x, _ in stroke_points(simplified).astype(int).tolist()]
+    assert len(kept) < len(points)
+    # Each dropped segment is now drawn at the width of the next kept point
+    following = 0
+    for index in range(1, len(points)):
+        while kept[following] < index:
+            following += 1
+        assert abs(widths[index] - widths[kept[following]]) <= TOLERANCE + 1e-6
+
+
+def test_zero_tolerance_keeps_everything():
+    stroke = make_stroke(handwriting(800, 1))
+    assert simplify_stroke(stroke, 0) is stroke